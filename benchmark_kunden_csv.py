@@ -0,0 +1,98 @@
+"""Benchmark of the Debitoren CSV rows: the row template vs. the former csv.DictWriter.
+
+Usage:
+    python benchmark_kunden_csv.py [--customers N] [--repeat N]
+
+Both writers get the same synthetic customers, their output is compared
+before the timings are printed. No database is needed.
+"""
+
+import argparse
+import csv
+import sys
+import time
+from io import StringIO
+from typing import Callable
+
+from database_kunden_csv_generator import CSV_HEADER_LIST, DBData, build_csv_data
+
+
+def synthetic_customers(count: int) -> list[DBData]:
+    return [
+        {
+            "konto_nr": 10000 + i if i % 10 else None,
+            "name": f"Kunde {i} \"Aufzugsbau\" GmbH & Co. KG;",
+            "kundennr": str(100000 + i),
+            "street": f"Hauptstraße {i % 200}",
+            "postal_code": str(1000 + i % 90000),
+            "city": "Köln",
+            "country": "DE",
+        }
+        for i in range(count)
+    ]
+
+
+def build_csv_data_dict_writer(data: list[DBData]) -> str:
+    """The former build_csv_data, a 150 key dict per customer written with csv.DictWriter."""
+    csv_buffer = StringIO()
+    writer = csv.DictWriter(
+        csv_buffer,
+        fieldnames=CSV_HEADER_LIST,
+        delimiter=";",
+        quotechar='"',
+        quoting=csv.QUOTE_NONNUMERIC,
+        lineterminator="\r\n",
+    )
+    writer.writeheader()
+
+    for entry in data:
+        name = entry.get("name", "")
+        postal_code = entry.get("postal_code", "")
+        if postal_code:
+            postal_code = postal_code.zfill(5)
+
+        csv_dict: dict[str, str | int | None] = {val: "" for val in CSV_HEADER_LIST}
+        csv_dict["Konto"] = entry.get("konto_nr", "")
+        csv_dict["Name (Adressattyp Unternehmen)"] = name
+        csv_dict["Kurzbezeichnung"] = name[:15]
+        csv_dict["Kunden-/Lief.-Nr."] = entry.get("kundennr", "")
+        csv_dict["Straße"] = entry.get("street", "")
+        csv_dict["Postleitzahl"] = postal_code
+        csv_dict["Ort"] = entry.get("city", "")
+        csv_dict["Land"] = "DE"
+
+        writer.writerow(csv_dict)
+
+    return csv_buffer.getvalue()
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = synthetic_customers(args.customers)
+    if build_csv_data(data) != build_csv_data_dict_writer(data):
+        print("The outputs differ")
+        return 1
+
+    dict_writer = best_time(lambda: build_csv_data_dict_writer(data), args.repeat)
+    template = best_time(lambda: build_csv_data(data), args.repeat)
+    print(f"{args.customers} customers, best of {args.repeat}:")
+    print(f"  csv.DictWriter:  {dict_writer:.2f}s")
+    print(f"  row template:    {template:.2f}s ({dict_writer / template:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""Differential check and benchmark of the lxml and the drafthorse invoice extractors.
+
+Usage:
+    python compare_xml_extractors.py INVOICE.xml|DIR [...] [--repeat N] [--no-mutations] [--baseline REV]
+
+Every XML is converted with both extractors and the resulting facts and
+ledgers (per invoice and per line item) are compared. Unless --no-mutations
+is given, every variant of the XML with one of the read elements removed is
+compared as well, so missing optional fields are covered.
+
+With --baseline, the final ledgers and LedgerImport of the lxml extractor are
+compared with those of retrieve_ledgers(Document.parse(...)) and
+zugfert_to_ledger_import of datev_creator/zugfert2ledger_import.py at the git
+revision REV, e.g. the commit before the extractors were introduced.
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from copy import deepcopy
+from dataclasses import asdict
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable
+
+from lxml import etree
+
+from datev_creator.cii_extractor import NS_RAM, NS_RSM, cii_facts_from_bytes
+from datev_creator.invoice_facts import InvoiceFacts, facts_from_document
+from datev_creator.ledger_import import LedgerImport, ledger_import_to_dict
+from datev_creator.zugfert2ledger_import import (
+    facts_to_ledger_import,
+    import_zugfert_bytes,
+    ledgers_from_facts,
+)
+
+# elements read by the extractors, removed one at a time for the mutations
+MUTATED_TAGS = [
+    f"{{{NS_RSM}}}ExchangedDocument",
+    *(
+        f"{{{NS_RAM}}}{tag}"
+        for tag in (
+            "ID",
+            "Name",
+            "CityName",
+            "CountryID",
+            "PostalTradeAddress",
+            "SpecifiedTaxRegistration",
+            "InvoiceCurrencyCode",
+            "GrandTotalAmount",
+            "ActualDeliverySupplyChainEvent",
+            "OccurrenceDateTime",
+            "SpecifiedTradeProduct",
+            "LineTotalAmount",
+            "RateApplicablePercent",
+            "BuyerOrderReferencedDocument",
+            "SpecifiedTradePaymentTerms",
+        )
+    ),
+]
+
+
+def drafthorse_facts(xml: bytes) -> InvoiceFacts:
+    return facts_from_document(import_zugfert_bytes(xml))
+
+
+def load_baseline(revision: str) -> ModuleType:
+    """datev_creator/zugfert2ledger_import.py of the git `revision` as a module."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:datev_creator/zugfert2ledger_import.py"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        check=True,
+    ).stdout
+    module = ModuleType(f"baseline_{revision}")
+    exec(compile(source, f"{revision}:zugfert2ledger_import.py", "exec"), vars(module))  # noqa: S102  # nosec
+    return module
+
+
+LEDGER_OUTCOMES = ("ledger_import", "item_ledgers")
+
+
+def _ledgers_outcome(
+    create_import: Callable[[], LedgerImport],
+    create_item_ledgers: Callable[[], list[Any]],
+) -> dict[str, Any]:
+    """The LedgerImport and the ledgers per line item, or the exception types."""
+    outcome: dict[str, Any] = {}
+    for name, create in zip(
+        LEDGER_OUTCOMES,
+        (
+            lambda: ledger_import_to_dict(create_import()),
+            lambda: [asdict(ledger) for ledger in create_item_ledgers()],
+        ),
+    ):
+        try:
+            outcome[name] = create()
+        except Exception as e:
+            outcome[name] = f"raises {type(e).__name__}"
+    return outcome
+
+
+def _outcome(extract: Callable[[bytes], InvoiceFacts], xml: bytes) -> Any:
+    """Everything the converter creates from `xml`, or the exception type."""
+    try:
+        facts = extract(xml)
+    except Exception as e:
+        return f"raises {type(e).__name__}"
+
+    return {
+        "facts": asdict(facts),
+        **_ledgers_outcome(
+            lambda: facts_to_ledger_import(facts)[0],
+            lambda: ledgers_from_facts(facts, lambda c, i: None, True),
+        ),
+    }
+
+
+def _current_ledgers(xml: bytes) -> dict[str, Any]:
+    """The final ledgers of the lxml extractor, comparable with _baseline_ledgers."""
+    try:
+        facts = cii_facts_from_bytes(xml)
+    except Exception as e:
+        return dict.fromkeys(LEDGER_OUTCOMES, f"raises {type(e).__name__}")
+    return _ledgers_outcome(
+        lambda: facts_to_ledger_import(facts)[0],
+        lambda: ledgers_from_facts(facts, lambda c, i: None, True),
+    )
+
+
+def _baseline_ledgers(baseline: ModuleType, xml: bytes) -> dict[str, Any]:
+    """The final ledgers of the `baseline` module, which only reads files."""
+    try:
+        document = baseline.Document.parse(xml)
+    except Exception as e:
+        return dict.fromkeys(LEDGER_OUTCOMES, f"raises {type(e).__name__}")
+    with tempfile.TemporaryDirectory() as folder:
+        xml_path = Path(folder) / "invoice.xml"
+        xml_path.write_bytes(xml)
+        return _ledgers_outcome(
+            lambda: baseline.zugfert_to_ledger_import(xml_path)[0],
+            lambda: baseline.retrieve_ledgers(document, lambda c, i: None, True),
+        )
+
+
+def mutations(xml: bytes) -> list[tuple[str, bytes]]:
+    root = etree.fromstring(xml)
+    variants = []
+    for tag in MUTATED_TAGS:
+        count = len(root.findall(f".//{tag}"))
+        for i in range(count):
+            mutated = deepcopy(root)
+            node = mutated.findall(f".//{tag}")[i]
+            node.getparent().remove(node)
+            name = f"without {tag.split('}')[1]} #{i + 1}"
+            variants.append((name, etree.tostring(mutated)))
+    return variants
+
+
+def compare(name: str, xml: bytes, baseline: ModuleType | None = None) -> bool:
+    if baseline is None:
+        label = "drafthorse"
+        expected = _outcome(drafthorse_facts, xml)
+        actual = _outcome(cii_facts_from_bytes, xml)
+    else:
+        label = "baseline"
+        expected = _baseline_ledgers(baseline, xml)
+        actual = _current_ledgers(xml)
+    if expected == actual:
+        return True
+    print(f"MISMATCH {name}")
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected:
+            if expected[key] != actual.get(key):
+                print(f"  {key}:")
+                print(f"    {label:>10}: {expected[key]}")
+                print(f"    {'lxml':>10}: {actual.get(key)}")
+    else:
+        print(f"  {label:>10}: {expected}\n  {'lxml':>10}: {actual}")
+    return False
+
+
+def benchmark(files: list[tuple[Path, bytes]], repeat: int) -> None:
+    for label, extract in (
+        ("drafthorse", drafthorse_facts),
+        ("lxml", cii_facts_from_bytes),
+    ):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, xml in files:
+                extract(xml)
+        elapsed = time.perf_counter() - start
+        count = repeat * len(files)
+        print(
+            f"{label:>10}: {elapsed / count * 1000:.3f} ms per invoice ({count} runs)"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", type=Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-mutations", action="store_true")
+    parser.add_argument(
+        "--baseline",
+        metavar="REV",
+        help="compare the final ledgers with zugfert2ledger_import.py of this git revision",
+    )
+    args = parser.parse_args()
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    files: list[tuple[Path, bytes]] = []
+    for path in args.paths:
+        for file in sorted(path.glob("*.xml")) if path.is_dir() else [path]:
+            files.append((file, file.read_bytes()))
+
+    checked = 0
+    failed = 0
+    for file, xml in files:
+        cases = [(file.name, xml)]
+        if not args.no_mutations:
+            cases += [
+                (f"{file.name} {name}", variant) for name, variant in mutations(xml)
+            ]
+        for name, variant in cases:
+            checked += 1
+            failed += not compare(name, variant, baseline)
+    print(f"{checked - failed}/{checked} identical")
+
+    # only benchmark invoices both extractors can convert
+    convertible = []
+    for file, xml in files:
+        try:
+            drafthorse_facts(xml)
+            convertible.append((file, xml))
+        except Exception as e:
+            print(f"not benchmarked {file.name}: {type(e).__name__}: {e}")
+    if convertible:
+        benchmark(convertible, args.repeat)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,16 @@
-from .main_app import App
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .main_app import App
 
 __all__ = ["App"]
+
+
+def __getattr__(name: str):
+    # App is imported lazily so `converter_app.settings` can be used by
+    # datev_creator without pulling in the GUI (and a circular import)
+    if name == "App":
+        from .main_app import App
+
+        return App
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,22 @@
-from . import App
+import sys
 
-app = App()
-app.run()
+if __name__ == "__main__":
+    # guarded, the import process pool re-imports the main module on spawn
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        # headless, must not import the GUI (tkinter)
+        from .cli import main
+
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "sync-mirror":
+        from .local_mirror import main as sync_mirror
+
+        sys.exit(sync_mirror(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "import-accounts":
+        from .account_index import main as import_accounts
+
+        sys.exit(import_accounts(sys.argv[2:]))
+
+    from . import App
+
+    app = App()
+    app.run()
@@ -0,0 +1,239 @@
+"""Persistent index of the Personenkonten of previous DATEV exports.
+
+Many account numbers are only correct in DATEV. The index maps customer
+numbers (from Debitoren/Kreditoren exports) and invoice numbers (Belegfeld 1
+of Buchungsstapel exports) to the Personenkonto and is checked before the
+database, see database_retrieve_account_no.
+
+Fill it with `python -m converter_app import-accounts EXPORT.csv [...]`.
+"""
+
+import argparse
+import csv
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Iterable, Iterator, Sequence
+
+from converter_app.settings import settings_file
+from datev_creator.csv_builder import BuchungsstapelItem, FormatCategory, Header
+
+INDEX_FILE = settings_file.parent / "account_index.sqlite3"
+
+# kinds of keys, like the keys of the account number cache
+CUSTOMER = "KdNr"
+INVOICE = "RgNr"
+
+# customer number columns of Debitoren/Kreditoren exports, DATEV and ours
+_CUSTOMER_COLUMNS = ("Kundennummer", "Kunden-/Lief.-Nr.")
+_ACCOUNT_COLUMN = "Konto"
+# rows per executemany() and keys per IN (...) query
+BATCH_SIZE = 500
+
+
+@dataclass
+class IndexImportResult:
+    path: Path
+    format_name: str
+    entries: int = 0
+    skipped: int = 0
+
+
+def _format_category(header_line: str) -> FormatCategory:
+    fields = header_line.split(";")
+    if len(fields) < 3 or fields[0].strip('"') not in ("EXTF", "DTVF"):
+        raise ValueError("Not a DATEV export, the first line is not an EXTF/DTVF header")
+    return FormatCategory(int(fields[2]))
+
+
+def _buchungsstapel_entries(
+    rows: Iterator[list[str]], sachkontenlaenge: int
+) -> Iterator[tuple[str, str] | None]:
+    for row in rows:
+        if len(row) != 125:
+            yield None
+            continue
+        item = BuchungsstapelItem(*row)
+        # the Personenkonto is the account longer than the Sachkonten
+        accounts = [
+            account
+            for account in (item.Gegenkonto, item.Konto)
+            if len(account) > sachkontenlaenge
+        ]
+        if not item.Belegfeld_1 or not accounts:
+            yield None
+            continue
+        yield item.Belegfeld_1, accounts[0]
+
+
+def _debitoren_entries(
+    rows: Iterator[list[str]], column_names: list[str]
+) -> Iterator[tuple[str, str] | None]:
+    customer_columns = [c for c in _CUSTOMER_COLUMNS if c in column_names]
+    if not customer_columns or _ACCOUNT_COLUMN not in column_names:
+        raise ValueError(
+            f"Expected the columns {_ACCOUNT_COLUMN} and one of {_CUSTOMER_COLUMNS}"
+        )
+    customer_index = column_names.index(customer_columns[0])
+    account_index = column_names.index(_ACCOUNT_COLUMN)
+    for row in rows:
+        if len(row) <= max(customer_index, account_index):
+            yield None
+            continue
+        customer_number = row[customer_index].strip()
+        account_no = row[account_index].strip()
+        if not customer_number or not account_no:
+            yield None
+            continue
+        yield customer_number, account_no
+
+
+class AccountIndex:
+    """The index, a SQLite database that is only created by imports."""
+
+    def __init__(self, path: Path = INDEX_FILE):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS accounts (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    account_no TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    imported_at REAL NOT NULL,
+                    PRIMARY KEY (kind, key)
+                )"""
+            )
+        return self._db
+
+    def exists(self) -> bool:
+        return self._db is not None or self.path.exists()
+
+    def lookup(self, kind: str, keys: Iterable[str]) -> dict[str, str]:
+        """Return the indexed account numbers of the `keys` of `kind` (CUSTOMER or INVOICE), keys without account are left out."""
+        keys = list(keys)
+        found: dict[str, str] = {}
+        if not self.exists():
+            return found
+        with self._lock:
+            db = self._connection()
+            for i in range(0, len(keys), BATCH_SIZE):
+                chunk = keys[i : i + BATCH_SIZE]
+                placeholders = ", ".join(["?"] * len(chunk))
+                found.update(
+                    db.execute(
+                        f"SELECT key, account_no FROM accounts WHERE kind = ? AND key IN ({placeholders})",  # noqa: S608  # nosec
+                        (kind, *chunk),
+                    )
+                )
+        return found
+
+    def import_export(self, path: Path) -> IndexImportResult:
+        """Add the accounts of a Buchungsstapel or Debitoren/Kreditoren export, they replace earlier entries of the same key.
+
+        The file is streamed and written in batches, in a single transaction.
+
+        Raises:
+            ValueError: if `path` is no Buchungsstapel or Debitoren/Kreditoren export.
+
+        """
+        with open(path, encoding="iso-8859-1", newline="") as f:
+            header_line = f.readline().rstrip("\r\n")
+            category = _format_category(header_line)
+            rows = csv.reader(f, delimiter=";")
+            column_names = next(rows, [])
+            if category == FormatCategory.BOOKING_BATCH:
+                kind = INVOICE
+                header = Header.from_csv_header(header_line)
+                entries = _buchungsstapel_entries(rows, header.sachkontenlaenge)
+            elif category == FormatCategory.DEBITORS_CREDITORS:
+                kind = CUSTOMER
+                entries = _debitoren_entries(rows, column_names)
+            else:
+                raise ValueError(
+                    f"{category.get_name()} exports contain no Personenkonten"
+                )
+
+            result = IndexImportResult(path, category.get_name())
+            imported_at = time.time()
+            batch: list[tuple[str, str, str, str, float]] = []
+            with self._lock:
+                db = self._connection()
+                with db:
+                    for entry in entries:
+                        if entry is None:
+                            result.skipped += 1
+                            continue
+                        batch.append((kind, *entry, str(path), imported_at))
+                        if len(batch) >= BATCH_SIZE:
+                            self._insert(db, batch)
+                            result.entries += len(batch)
+                            batch = []
+                    self._insert(db, batch)
+                    result.entries += len(batch)
+        return result
+
+    @staticmethod
+    def _insert(
+        db: sqlite3.Connection, batch: list[tuple[str, str, str, str, float]]
+    ) -> None:
+        db.executemany(
+            "INSERT OR REPLACE INTO accounts (kind, key, account_no, source, imported_at) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+
+    def clear(self) -> None:
+        if not self.exists():
+            return
+        with self._lock:
+            with self._connection() as db:
+                db.execute("DELETE FROM accounts")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+account_index = AccountIndex()
+"""The index of the app, in account_index.sqlite3 next to settings.json."""
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m converter_app import-accounts",
+        description="Add the Personenkonten of DATEV Buchungsstapel and Debitoren/Kreditoren exports to the account index.",
+    )
+    parser.add_argument(
+        "files", type=Path, nargs="*", help="exports, later files win on conflicts"
+    )
+    parser.add_argument(
+        "--clear", action="store_true", help="empty the index before importing"
+    )
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.clear:
+        account_index.clear()
+    exit_code = 0
+    for path in args.files:
+        try:
+            result = account_index.import_export(path)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            exit_code = 1
+            continue
+        print(
+            f"{path}: {result.entries} accounts from {result.format_name}, {result.skipped} rows skipped"
+        )
+    return exit_code
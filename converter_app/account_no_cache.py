@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Hashable, Iterable
+
+
+class AccountNoCache:
+    """In-process LRU cache of looked up account numbers with a time to live.
+
+    Lookups without a result (e.g. customers without DatevKtrNr) are cached
+    too, with their own (usually shorter) time to live, so a missing account
+    is not queried again for every invoice of the customer.
+
+    If `generation` is given, all entries are dropped whenever its value
+    changes, e.g. when another process changed account numbers.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl: float = 3600.0,
+        negative_ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+        generation: Callable[[], Hashable] | None = None,
+    ):
+        """Create an empty cache.
+
+        Args:
+            max_size (int, optional): Maximum number of entries, the least recently used are dropped first. Defaults to 10_000.
+            ttl (float, optional): Seconds an account number is used before it is looked up again. Defaults to 3600.0.
+            negative_ttl (float, optional): Seconds a lookup without result is cached, 0 disables negative caching. Defaults to 300.0.
+            clock (Callable[[], float], optional): Time source in seconds. Defaults to time.monotonic.
+            generation (Callable[[], Hashable] | None, optional): Returns the current generation of the account numbers, checked on every lookup. Defaults to None (never invalidated by others).
+
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        # key -> (expiry time, account number or None)
+        self._entries: OrderedDict[Hashable, tuple[float, str | None]] = OrderedDict()
+        self._lock = Lock()
+        self._generation = generation
+        self._seen_generation = generation() if generation is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Hashable) -> tuple[bool, str | None]:
+        """Return (True, account number or None) if `key` is cached, else (False, None)."""
+        with self._lock:
+            if self._generation is not None:
+                generation = self._generation()
+                if generation != self._seen_generation:
+                    self._entries.clear()
+                    self._seen_generation = generation
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, account_no: str | None) -> None:
+        ttl = self.ttl if account_no is not None else self.negative_ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, account_no)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_retrieve(
+        self, key: Hashable, retrieve: Callable[[], str | None]
+    ) -> str | None:
+        """Return the cached account number of `key`, calls `retrieve` and caches its result on a miss."""
+        found, account_no = self.lookup(key)
+        if not found:
+            account_no = retrieve()
+            self.put(key, account_no)
+        return account_no
+
+    def invalidate(self, keys: Iterable[Hashable] | None = None) -> None:
+        """Drop `keys` from the cache, all entries if None, e.g. after account numbers were changed in the database."""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups > 0 else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {len(self)} entries"
@@ -1,7 +1,5 @@
 from datetime import datetime
 from pathlib import Path
-from tkinter.filedialog import asksaveasfilename
-from tkinter.messagebox import askyesno
 from typing import Mapping
 
 from converter_app.settings import Settings
@@ -21,7 +19,8 @@ from datev_creator.utils import SOFTWARE_NAME
 from datev_creator.zip_builder import build_zip
 
 
-def build_archive_and_save(data: Mapping[Path, LedgerImportWMetadataUUID]):
+def build_archive(data: Mapping[Path, LedgerImportWMetadataUUID]) -> Archive:
+    """Build the DATEV archive (document.xml) listing the PDFs and their ledger XMLs."""
     documents: list[ArchiveDocument] = []
 
     for pdf_file, (_, (year, month), uu_id) in data.items():
@@ -58,7 +57,7 @@ def build_archive_and_save(data: Mapping[Path, LedgerImportWMetadataUUID]):
             )
         )
 
-    archive_xml = Archive(
+    return Archive(
         header=ArchiveHeader(
             date=datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
             description=None,
@@ -70,6 +69,45 @@ def build_archive_and_save(data: Mapping[Path, LedgerImportWMetadataUUID]):
         generating_system=SOFTWARE_NAME,
     )
 
+
+def save_archive(
+    data: Mapping[Path, LedgerImportWMetadataUUID],
+    zip_path: Path,
+    csv_path: Path | None = None,
+    max_workers: int | None = None,
+) -> int:
+    """Build the ZIP (and optionally the Buchungsstapel CSV) without any dialogs.
+
+    Args:
+        data (Mapping[Path, LedgerImportWMetadataUUID]): The PDFs and their ledgers.
+        zip_path (Path): Where to write the ZIP file.
+        csv_path (Path | None, optional): Where to write the CSV file. Defaults to None (no CSV).
+        max_workers (int | None, optional): Processes validating the ledger XMLs, see build_zip. Defaults to None (number of CPUs).
+
+    Returns:
+        int: Number of ledgers skipped in the CSV due to missing account numbers.
+
+    """
+    skipped = 0
+    if csv_path is not None:
+        skipped = build_csv(data, csv_path)
+
+    build_zip(
+        archive=build_archive(data),
+        documents=[
+            (pdf.with_suffix(".xml").name, ledger[0]) for pdf, ledger in data.items()
+        ],
+        out_path=zip_path,
+        other_files=data.keys(),
+        max_workers=max_workers,
+    )
+    return skipped
+
+
+def build_archive_and_save(data: Mapping[Path, LedgerImportWMetadataUUID]):
+    from tkinter.filedialog import asksaveasfilename
+    from tkinter.messagebox import askyesno, showwarning
+
     # ask zip save location
 
     zip_path = Path(
@@ -92,6 +130,7 @@ def build_archive_and_save(data: Mapping[Path, LedgerImportWMetadataUUID]):
         title="Build CSV",
         message="Do you want to build a CSV file for the ledgers?",
     )
+    csv_path: Path | None = None
     if should_build_csv:
         csv_path_suggestion = zip_path.with_suffix(".csv")
         csv_path = Path(
@@ -107,17 +146,9 @@ def build_archive_and_save(data: Mapping[Path, LedgerImportWMetadataUUID]):
             print("No CSV file selected.")
             return
 
-        build_csv(data, csv_path)
-
-    try:
-        build_zip(
-            archive=archive_xml,
-            documents=[
-                (pdf.with_suffix(".xml").name, ledger[0])
-                for pdf, ledger in data.items()
-            ],
-            out_path=zip_path,
-            other_files=data.keys(),
+    skipped = save_archive(data, zip_path, csv_path)
+    if skipped > 0:
+        showwarning(
+            "Missing account numbers",
+            f"Skipped {skipped} ledgers due to missing account numbers.",
         )
-    except Exception as e:
-        raise e
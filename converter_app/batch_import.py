@@ -0,0 +1,277 @@
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+from converter_app.import_cache import ImportCache
+from converter_app.settings import Settings
+from datev_creator.ledger_import import LedgerImportWMetadata
+from datev_creator.pdf_attachment import (
+    extract_invoice_xml,
+    may_contain_invoice_xml,
+)
+from datev_creator.zugfert2ledger_import import (
+    BulkAccountNoRetrieval,
+    assign_bp_account_no,
+    assign_bp_account_nos,
+    zugfert_bytes_to_ledger_import,
+    zugfert_to_ledger_import,
+)
+
+
+@dataclass
+class PdfImportResult:
+    """Result of importing a single PDF.
+
+    `ledger` is None if the PDF has no embedded XML or the import failed,
+    `error` is only set in the latter case. `prefiltered` is set if the PDF
+    was rejected by the pre-filter without parsing it and `seconds` is the
+    time spent reading the PDF (pre-filter or XML extraction, not the
+    conversion).
+    """
+
+    pdf: Path
+    ledger: LedgerImportWMetadata | None = None
+    error: str | None = None
+    xml: bytes | None = None
+    cached: bool = False
+    prefiltered: bool = False
+    seconds: float = 0.0
+
+
+def _extract(pdf: Path, debug_xml_dir: Path | None = None) -> bytes | None:
+    if not pdf.exists() or not pdf.is_file():
+        raise FileNotFoundError(f"The file {pdf} does not exist or is not a file.")
+
+    xml = extract_invoice_xml(pdf)
+    if xml is not None and debug_xml_dir is not None:
+        with open(debug_xml_dir / (pdf.name + ".xml"), "wb") as xml_file:
+            xml_file.write(xml)
+    return xml
+
+
+def import_x_rechnung(
+    pdf: Path, debug_xml_dir: Path | None = None
+) -> LedgerImportWMetadata | None:
+    """Import the X-Rechnung embedded in `pdf` without looking up account numbers.
+
+    Args:
+        pdf (Path): The PDF file.
+        debug_xml_dir (Path | None, optional): If set, the extracted XML is also written to `<debug_xml_dir>/<pdf name>.xml`. Defaults to None.
+
+    Returns:
+        LedgerImportWMetadata | None: None if the PDF has no embedded XML.
+
+    """
+    xml = _extract(pdf, debug_xml_dir)
+    if xml is None:
+        return None
+    return zugfert_bytes_to_ledger_import(xml)
+
+
+def _import_pdf(
+    pdf: Path, debug_xml_dir: Path | None = None, prefilter: bool = True
+) -> PdfImportResult:
+    # runs in the worker processes, so every failure is turned into a result
+    result = PdfImportResult(pdf)
+    start = time.perf_counter()
+    try:
+        if prefilter and pdf.is_file() and not may_contain_invoice_xml(pdf):
+            result.prefiltered = True
+            result.seconds = time.perf_counter() - start
+            return result
+
+        result.xml = _extract(pdf, debug_xml_dir)
+        result.seconds = time.perf_counter() - start
+        if result.xml is not None:
+            result.ledger = zugfert_bytes_to_ledger_import(result.xml)
+    except Exception as e:
+        result.ledger = None
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _future_result(pdf: Path, future: Future[PdfImportResult]) -> PdfImportResult:
+    try:
+        return future.result()
+    except Exception as e:  # e.g. BrokenProcessPool when a worker dies
+        return PdfImportResult(pdf, error=f"{type(e).__name__}: {e}")
+
+
+def import_pdfs_batch(
+    pdfs: Iterable[Path],
+    bp_account_no_retrieval: Callable[[str | None, str], str | None] | None = None,
+    max_workers: int | None = None,
+    debug_xml_dir: Path | None = None,
+    cache: ImportCache | None = None,
+    prefilter: bool = True,
+    bp_account_nos_retrieval: BulkAccountNoRetrieval | None = None,
+) -> list[PdfImportResult]:
+    """Import many PDFs in parallel.
+
+    PDF parsing, XML extraction and the ledger mapping run in a process pool.
+    The account numbers are looked up afterwards in the calling process, so the
+    retrieval function does not need to be picklable and database connections
+    are not shared between processes.
+
+    Args:
+        pdfs (Iterable[Path]): PDFs to import.
+        bp_account_no_retrieval (Callable[[str | None, str], str | None] | None, optional): function retrieveing account_no given a [customer_number] and invoice ID. Defaults to None (no lookup).
+        max_workers (int | None, optional): Size of the process pool, 1 imports in the calling process. Defaults to None (number of CPUs).
+        debug_xml_dir (Path | None, optional): Directory to dump the extracted XML files to for debugging. Defaults to None.
+        cache (ImportCache | None, optional): Cache of previous imports, only PDFs missing in it are imported. Defaults to None.
+        prefilter (bool, optional): Skip parsing PDFs that clearly have no embedded XML, see may_contain_invoice_xml. Defaults to True.
+        bp_account_nos_retrieval (BulkAccountNoRetrieval | None, optional): Looks up the account numbers of all PDFs at once, used instead of `bp_account_no_retrieval`, e.g. get_datev_account_nos. Defaults to None.
+
+    Returns:
+        list[PdfImportResult]: One result per PDF, in input order.
+
+    """
+    pdf_list = list(pdfs)
+    results: list[PdfImportResult | None] = [None] * len(pdf_list)
+
+    # indices of the PDFs that are not in the cache
+    to_import: list[int] = []
+    for i, pdf in enumerate(pdf_list):
+        entry = cache.get(pdf) if cache is not None and pdf.is_file() else None
+        if entry is None:
+            to_import.append(i)
+        else:
+            results[i] = PdfImportResult(pdf, entry.ledger, xml=entry.xml, cached=True)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(to_import))
+
+    # create settings.json before the workers read it
+    Settings.getinstance()
+
+    if max_workers <= 1:
+        for i in to_import:
+            results[i] = _import_pdf(pdf_list[i], debug_xml_dir, prefilter)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                (
+                    i,
+                    executor.submit(
+                        _import_pdf, pdf_list[i], debug_xml_dir, prefilter
+                    ),
+                )
+                for i in to_import
+            ]
+            for i, future in futures:
+                results[i] = _future_result(pdf_list[i], future)
+
+    done = [result for result in results if result is not None]
+
+    if cache is not None:
+        # before the account lookup, account numbers must not end up in the cache
+        for result in done:
+            if not result.cached and result.error is None:
+                cache.put(result.pdf, result.xml, result.ledger)
+
+    if bp_account_nos_retrieval is not None:
+        imported = [result for result in done if result.ledger is not None]
+        try:
+            assign_bp_account_nos(
+                [result.ledger[0] for result in imported if result.ledger is not None],
+                bp_account_nos_retrieval,
+            )
+        except Exception as e:
+            for result in imported:
+                result.ledger = None
+                result.error = f"{type(e).__name__}: {e}"
+    elif bp_account_no_retrieval is not None:
+        for result in done:
+            if result.ledger is None:
+                continue
+            try:
+                assign_bp_account_no(result.ledger[0], bp_account_no_retrieval)
+            except Exception as e:
+                result.ledger = None
+                result.error = f"{type(e).__name__}: {e}"
+
+    return done
+
+
+def prefilter_summary(
+    results: Iterable[PdfImportResult],
+) -> tuple[int, float | None]:
+    """Number of PDFs skipped by the pre-filter and an estimate of the time that saved.
+
+    The time a full parse would have taken is estimated from the extraction
+    time of the PDFs that were parsed.
+
+    Returns:
+        tuple[int, float | None]: (skipped PDFs, estimated seconds saved), the estimate is None if no PDF was parsed.
+
+    """
+    skipped: list[float] = []
+    parsed: list[float] = []
+    for result in results:
+        if result.cached:
+            continue
+        if result.prefiltered:
+            skipped.append(result.seconds)
+        elif result.seconds > 0:
+            parsed.append(result.seconds)
+
+    if len(skipped) == 0:
+        return 0, 0.0
+    if len(parsed) == 0:
+        return len(skipped), None
+    parse_time = sum(parsed) / len(parsed)
+    return len(skipped), max(parse_time * len(skipped) - sum(skipped), 0.0)
+
+
+def format_prefilter_summary(results: Iterable[PdfImportResult]) -> str | None:
+    """Human readable prefilter_summary, None if no PDF was skipped."""
+    skipped, seconds_saved = prefilter_summary(results)
+    if skipped == 0:
+        return None
+    saved = "unknown" if seconds_saved is None else f"~{seconds_saved:.2f}s"
+    return f"Pre-filter skipped {skipped} PDFs without invoice XML, time saved: {saved}"
+
+
+def find_xml_for_pdf(pdf: Path, xml_folder: Path) -> Path | None:
+    """Return `<stem>.xml` or `<stem>_rg.xml` of `pdf` in `xml_folder` if it exists."""
+    for xml_file in (
+        xml_folder / (pdf.stem + ".xml"),
+        xml_folder / (pdf.stem + "_rg" + ".xml"),
+    ):
+        if xml_file.is_file():
+            return xml_file
+    return None
+
+
+def import_xml_file(
+    xml_path: Path,
+    bp_account_no_retrieval: Callable[[str | None, str], str | None] | None = None,
+    cache: ImportCache | None = None,
+) -> LedgerImportWMetadata:
+    """Import a single X-Rechnung XML file, using `cache` for files imported before.
+
+    Args:
+        xml_path (Path): The XML file.
+        bp_account_no_retrieval (Callable[[str | None, str], str | None] | None, optional): function retrieveing account_no given a [customer_number] and invoice ID. Defaults to None (no lookup).
+        cache (ImportCache | None, optional): Cache of previous imports. Defaults to None.
+
+    Returns:
+        LedgerImportWMetadata: The imported ledgers with (year, month).
+
+    """
+    entry = cache.get(xml_path) if cache is not None else None
+    if entry is not None and entry.ledger is not None:
+        ledger = entry.ledger
+    else:
+        ledger = zugfert_to_ledger_import(xml_path)
+        if cache is not None:
+            # the XML itself is on disk, only the conversion is cached
+            cache.put(xml_path, None, ledger)
+
+    if bp_account_no_retrieval is not None:
+        assign_bp_account_no(ledger[0], bp_account_no_retrieval)
+    return ledger
@@ -0,0 +1,176 @@
+"""Headless batch conversion, e.g. for cron jobs.
+
+Runs the same pipeline as the GUI (PDF/XML import, account lookup, ZIP and
+CSV) but never imports tkinter.
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Sequence
+from uuid import uuid4
+
+from converter_app.archive_builder import save_archive
+from converter_app.batch_import import (
+    find_xml_for_pdf,
+    format_prefilter_summary,
+    import_pdfs_batch,
+    import_xml_file,
+)
+from converter_app.database_retrieve_account_no import (
+    account_no_cache,
+    get_datev_account_nos,
+)
+from converter_app.import_cache import ImportCache
+from converter_app.settings import Settings
+from datev_creator.ledger_import import (
+    LedgerImport,
+    LedgerImportWMetadata,
+    LedgerImportWMetadataUUID,
+)
+from datev_creator.xml_validator import schema_timings
+from datev_creator.zugfert2ledger_import import assign_bp_account_nos
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m converter_app batch",
+        description="Convert all PDFs of a folder into a DATEV ZIP (and CSV) without the GUI.",
+    )
+    parser.add_argument(
+        "--pdf-dir", type=Path, required=True, help="folder with the invoice PDFs"
+    )
+    parser.add_argument(
+        "--xml-dir",
+        type=Path,
+        help="folder with <name>.xml / <name>_rg.xml for PDFs without embedded XML",
+    )
+    parser.add_argument("--zip", type=Path, required=True, help="ZIP file to write")
+    parser.add_argument("--csv", type=Path, help="Buchungsstapel CSV file to write")
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--skip-missing",
+        action="store_true",
+        help="leave out PDFs without XML data instead of aborting",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="fully parse every PDF, even if it clearly has no embedded XML",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="do not use the import cache"
+    )
+    return parser
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Run the batch conversion described by the parsed `args`, returns the exit code."""
+    settings = Settings.getinstance()
+    if args.csv is not None and not settings.check_csv_settings():
+        print("Settings incomplete, complete the settings needed for csv generation.")
+        return 2
+
+    if not args.pdf_dir.is_dir():
+        print(f"PDF directory does not exist: {args.pdf_dir}")
+        return 2
+    if args.xml_dir is not None and not args.xml_dir.is_dir():
+        print(f"XML directory does not exist: {args.xml_dir}")
+        return 2
+
+    pdfs = sorted(args.pdf_dir.glob("*.pdf"))
+    if len(pdfs) == 0:
+        print(f"No PDFs found in {args.pdf_dir}")
+        return 2
+
+    cache = None if args.no_cache else ImportCache()
+
+    start = time.perf_counter()
+    ledgers: dict[Path, LedgerImportWMetadata | None] = {}
+    errors: list[str] = []
+    from_cache = 0
+    xml_ledgers: list[LedgerImport] = []
+    results = import_pdfs_batch(
+        pdfs,
+        max_workers=args.jobs,
+        cache=cache,
+        prefilter=not args.no_prefilter,
+        bp_account_nos_retrieval=get_datev_account_nos,
+    )
+    for result in results:
+        ledgers[result.pdf] = result.ledger
+        from_cache += result.cached
+        if result.error is not None:
+            errors.append(f"{result.pdf.name}: {result.error}")
+
+    if args.xml_dir is not None:
+        for pdf, ledger in ledgers.items():
+            if ledger is not None:
+                continue
+            xml_file = find_xml_for_pdf(pdf, args.xml_dir)
+            if xml_file is None:
+                continue
+            try:
+                ledger = import_xml_file(xml_file, cache=cache)
+            except Exception as e:
+                errors.append(f"{xml_file.name}: {type(e).__name__}: {e}")
+                continue
+            ledgers[pdf] = ledger
+            xml_ledgers.append(ledger[0])
+        # one lookup for all XML files, like for the PDFs
+        assign_bp_account_nos(xml_ledgers, get_datev_account_nos)
+    import_time = time.perf_counter() - start
+
+    prefilter_message = format_prefilter_summary(results)
+    if prefilter_message is not None:
+        print(prefilter_message)
+
+    for error in errors:
+        print(f"Import error: {error}")
+    missing = [pdf.name for pdf, ledger in ledgers.items() if ledger is None]
+    if len(missing) > 0:
+        print(f"No XML data for {len(missing)} PDFs: {', '.join(missing)}")
+        if not args.skip_missing:
+            print("Nothing written, use --skip-missing to convert the other PDFs.")
+            return 1
+
+    data: dict[Path, LedgerImportWMetadataUUID] = {
+        pdf: (ledger[0], ledger[1], uuid4())
+        for pdf, ledger in ledgers.items()
+        if ledger is not None
+    }
+    if len(data) == 0:
+        print("No PDFs to save.")
+        return 1
+
+    start = time.perf_counter()
+    try:
+        skipped = save_archive(
+            data, args.zip, args.csv, max_workers=args.jobs
+        )
+    except Exception as e:
+        print(f"An error occurred while saving: {type(e).__name__}: {e}")
+        return 1
+    save_time = time.perf_counter() - start
+
+    if skipped > 0:
+        print(f"Skipped {skipped} ledgers in the CSV due to missing account numbers.")
+
+    print(f"Account number cache: {account_no_cache.stats()}")
+    print(f"Schema validation: {schema_timings}")
+
+    total_time = import_time + save_time
+    print(
+        f"Converted {len(data)}/{len(pdfs)} PDFs "
+        f"({from_cache} from cache, {len(xml_ledgers)} from XML folder, "
+        f"{len(missing)} without XML data) in {total_time:.2f}s: "
+        f"import {import_time:.2f}s, ZIP/CSV {save_time:.2f}s, "
+        f"{len(pdfs) / total_time:.1f} PDFs/s"
+    )
+    return 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    return run_batch(build_parser().parse_args(argv))
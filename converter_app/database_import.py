@@ -0,0 +1,249 @@
+"""Import invoices from the Rechnungen and Kunden tables instead of their XML."""
+
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterable, Iterator, cast
+
+from converter_app.database_retrieve_account_no import get_datev_account_nos
+from converter_app.local_mirror import read_database
+from datev_creator.ledger_import import (
+    Consolidate,
+    LedgerImport,
+    LedgerImportWMetadata,
+)
+from datev_creator.utils import SOFTWARE_NAME
+from datev_creator.zugfert2ledger_import import (
+    LEDGER_XML_DATA,
+    BulkAccountNoRetrieval,
+    assign_bp_account_nos,
+    create_ledgger,
+    get_bu_code,
+)
+
+# invoice numbers per IN (...) query
+DATABASE_IMPORT_CHUNK_SIZE = 500
+# rows per fetchmany() call
+DATABASE_FETCH_SIZE = 500
+
+SELLER_TAX_ID = "DE163738087"
+GENERATOR_INFO = "Bombelczyk Aufzüge"
+
+INVOICE_SQL = """
+SELECT k.DatevKtrNr, k.KdNme1, k.KdOrt, k.KdNr, r.RgNr, r.RgDat, r.RgBrutto, r.Par13
+FROM Rechnungen r
+JOIN Kunden k on r.Kdidx = k.KdIdx
+"""
+
+
+@dataclass
+class DatabaseImportResult:
+    """Result of importing invoices from the database.
+
+    `not_found` are the PDFs without invoice in the database,
+    `missing_pdfs` the invoice numbers without PDF (date range import only)
+    and `errors` the messages of the rows that could not be imported.
+    """
+
+    imported: dict[Path, LedgerImportWMetadata] = field(default_factory=dict)
+    not_found: list[Path] = field(default_factory=list)
+    missing_pdfs: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+
+def invoice_id_of_pdf(pdf: Path) -> str:
+    """The invoice number (RgNr) of an invoice PDF named <RgNr>.pdf or <RgNr>_rg.pdf."""
+    return pdf.with_suffix("").name.removesuffix("_rg")
+
+
+def index_pdf_folder(folder: Path) -> dict[str, Path]:
+    """Map the invoice numbers of all PDFs in `folder` and its subfolders to the PDFs.
+
+    If several PDFs have the same invoice number the first in path order wins.
+    """
+    pdfs: list[Path] = []
+    for directory, _, file_names in os.walk(folder):
+        pdfs.extend(
+            Path(directory) / file_name
+            for file_name in file_names
+            if file_name.lower().endswith(".pdf")
+        )
+    index: dict[str, Path] = {}
+    for pdf in sorted(pdfs):
+        index.setdefault(invoice_id_of_pdf(pdf), pdf)
+    return index
+
+
+def ledger_import_from_row(row: Any) -> LedgerImportWMetadata:
+    """Build the LedgerImport of an invoice row of INVOICE_SQL, without account number.
+
+    Raises:
+        ValueError: if the row has an unexpected format or no BU code is configured for its tax rate.
+
+    """
+    if not isinstance(row, dict) or len(row) < 7:
+        raise ValueError(f"Unexpected data format from database: {row}")
+    issue_date_time = str(row["RgDat"])
+    item_amount = str(row["RgBrutto"])
+    invoice_id = str(row["RgNr"])
+    tax_rate = "19.00" if str(row["Par13"]) == "0" else "0.00"
+    buyer_name = cast(str, row["KdNme1"])
+
+    ledger_import = LedgerImport(
+        generator_info=GENERATOR_INFO,
+        xml_data=LEDGER_XML_DATA,
+        consolidate=Consolidate(
+            consolidated_amount=item_amount,
+            consolidated_date=issue_date_time,
+            consolidated_currency_code="EUR",
+            ledgers=[
+                create_ledgger(
+                    issue_date_time=issue_date_time,
+                    currency_code="EUR",
+                    buyer_name=buyer_name,
+                    buyer_city=cast(str, row["KdOrt"]),
+                    # looked up in bulk, see assign_bp_account_nos
+                    bp_account_no_retrieval=lambda customer_number, invoice_id: None,
+                    item_amount=item_amount,
+                    buyer_id=str(row["KdNr"]),
+                    invoice_id=invoice_id,
+                    bu_code=get_bu_code(tax_rate),
+                    tax_rate=tax_rate,
+                    seller_tax_id=SELLER_TAX_ID,
+                    ship_from_country="DE",
+                    buyer_tax_id=None,
+                    ship_to_country="DE",
+                    due_date=None,
+                    delivery_date=None,
+                    order_id=None,
+                    information_text=f"Ausgangsrechnung {invoice_id}",
+                    booking_text=buyer_name,
+                )
+            ],
+            consolidated_invoice_id=invoice_id,
+            consolidated_delivery_date=None,
+            consolidated_order_id=None,
+        ),
+        generating_system=SOFTWARE_NAME,
+    )
+    year_month = datetime.strptime(issue_date_time, "%Y-%m-%d").timetuple()[0:2]
+    return ledger_import, year_month
+
+
+def _chunks(values: list[str], chunk_size: int) -> Iterator[list[str]]:
+    for i in range(0, len(values), chunk_size):
+        yield values[i : i + chunk_size]
+
+
+def import_invoices_from_database(
+    pdfs: Iterable[Path],
+    bp_account_nos_retrieval: BulkAccountNoRetrieval = get_datev_account_nos,
+    chunk_size: int = DATABASE_IMPORT_CHUNK_SIZE,
+    fetch_size: int = DATABASE_FETCH_SIZE,
+) -> DatabaseImportResult:
+    """Import the invoices of `pdfs` from the database, by the invoice number in their file name.
+
+    The invoice numbers are queried in chunks of `chunk_size` and the rows
+    are fetched `fetch_size` at a time. The account numbers are looked up
+    in bulk per chunk, after the cursor is closed. If several PDFs have the
+    same invoice number only the first gets the invoice.
+
+    Args:
+        pdfs (Iterable[Path]): The invoice PDFs.
+        bp_account_nos_retrieval (BulkAccountNoRetrieval, optional): Looks up the account numbers. Defaults to get_datev_account_nos.
+        chunk_size (int, optional): Maximum number of invoice numbers per query. Defaults to DATABASE_IMPORT_CHUNK_SIZE.
+        fetch_size (int, optional): Rows per fetchmany() call. Defaults to DATABASE_FETCH_SIZE.
+
+    Returns:
+        DatabaseImportResult: The imported ledgers per PDF, the PDFs not found and the errors.
+
+    """
+    pdf_by_invoice_id: dict[str, Path] = {}
+    for pdf in pdfs:
+        pdf_by_invoice_id.setdefault(invoice_id_of_pdf(pdf), pdf)
+
+    result = DatabaseImportResult()
+    for chunk in _chunks(list(pdf_by_invoice_id), chunk_size):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        sql = f"{INVOICE_SQL} WHERE r.RgNr IN ({placeholders})"  # noqa: S608  # nosec
+        imported: list[LedgerImportWMetadata] = []
+        with read_database().cursor(dictionary=True) as mycursor:
+            mycursor.execute(sql, tuple(chunk))
+            while rows := mycursor.fetchmany(fetch_size):
+                for row in rows:
+                    try:
+                        ledger = ledger_import_from_row(row)
+                    except ValueError as e:
+                        result.errors.append(str(e))
+                        continue
+                    pdf = pdf_by_invoice_id.get(str(row["RgNr"]))
+                    if pdf is None:
+                        result.errors.append(
+                            f"Could not save document: {row['RgNr']}"
+                        )
+                        continue
+                    # like before, the last row of an invoice number wins
+                    result.imported[pdf] = ledger
+                    imported.append(ledger)
+        # not while the cursor is open, it may hold the only connection
+        assign_bp_account_nos(
+            [ledger[0] for ledger in imported], bp_account_nos_retrieval
+        )
+
+    result.not_found = [
+        pdf for pdf in pdf_by_invoice_id.values() if pdf not in result.imported
+    ]
+    return result
+
+
+def import_invoices_by_date(
+    first_day: date,
+    last_day: date,
+    pdf_folder: Path,
+    bp_account_nos_retrieval: BulkAccountNoRetrieval = get_datev_account_nos,
+    fetch_size: int = DATABASE_FETCH_SIZE,
+) -> DatabaseImportResult:
+    """Import all invoices dated from `first_day` to `last_day` from the database, without selecting PDFs.
+
+    The rows are streamed from an unbuffered (server-side) cursor and
+    converted as they arrive, the PDF of every invoice is looked up in an
+    index of `pdf_folder` built beforehand. The account numbers are looked
+    up in bulk once all rows were read.
+
+    Args:
+        first_day (date): First invoice date, inclusive.
+        last_day (date): Last invoice date, inclusive.
+        pdf_folder (Path): Folder with the invoice PDFs, searched recursively.
+        bp_account_nos_retrieval (BulkAccountNoRetrieval, optional): Looks up the account numbers. Defaults to get_datev_account_nos.
+        fetch_size (int, optional): Rows per fetchmany() call. Defaults to DATABASE_FETCH_SIZE.
+
+    Returns:
+        DatabaseImportResult: The imported ledgers per PDF, the invoice numbers without PDF and the errors.
+
+    """
+    pdf_by_invoice_id = index_pdf_folder(pdf_folder)
+
+    result = DatabaseImportResult()
+    sql = f"{INVOICE_SQL} WHERE r.RgDat >= %s AND r.RgDat < %s"  # noqa: S608  # nosec
+    with read_database().cursor(dictionary=True, buffered=False) as mycursor:
+        mycursor.execute(
+            sql, (first_day.isoformat(), (last_day + timedelta(days=1)).isoformat())
+        )
+        while rows := mycursor.fetchmany(fetch_size):
+            for row in rows:
+                try:
+                    ledger = ledger_import_from_row(row)
+                except ValueError as e:
+                    result.errors.append(str(e))
+                    continue
+                pdf = pdf_by_invoice_id.get(str(row["RgNr"]))
+                if pdf is None:
+                    result.missing_pdfs.append(str(row["RgNr"]))
+                    continue
+                result.imported[pdf] = ledger
+    # not while the cursor is open, it may hold the only connection
+    assign_bp_account_nos(
+        [ledger[0] for ledger in result.imported.values()], bp_account_nos_retrieval
+    )
+    return result
@@ -1,52 +1,81 @@
-from pathlib import Path
+import os
+import time
+from typing import Callable, Iterable, Iterator
 
+from converter_app.account_index import CUSTOMER, INVOICE, account_index
+from converter_app.account_no_cache import AccountNoCache
+from converter_app.local_mirror import read_database
+from converter_app.settings import settings_file
+from datev_creator.zugfert2ledger_import import AccountNoKey
 
-def validate_database_information_exists():
-    # check if this script directory has a subdirectory called database
-    script_dir = Path(__file__).parent
-    database_dir = script_dir / "database"
-    if not database_dir.exists():
-        # create database directory
-        database_dir.mkdir()
+# values per IN (...) query, well below the MySQL placeholder and packet limits
+ACCOUNT_NO_CHUNK_SIZE = 500
 
-    # check if credentials.py exists in database directory
-    credentials_file = database_dir / "credentials.py"
-    if not credentials_file.exists():
-        with open(credentials_file, "w", encoding="utf-8") as f:
-            f.write("""import mysql.connector
+# rewritten by other processes that change account numbers, e.g.
+# database_kunden_new_konto_nr.py, see signal_account_no_change
+ACCOUNT_NO_GENERATION_FILE = settings_file.parent / "account_no_generation"
 
-mydb = mysql.connector.connect(
-    host="", user="", password="", database=""
-)""")
 
+def _account_no_generation() -> tuple[int, int] | None:
+    try:
+        stat = os.stat(ACCOUNT_NO_GENERATION_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
-try:
-    from .database.credentials import mydb
-except ImportError:
-    validate_database_information_exists()
-    raise
 
+def signal_account_no_change() -> None:
+    """Make the account number caches of all running converters drop their entries at their next lookup.
 
-def get_datev_account_no(customer_number: str | None, invoice_id: str) -> str | None:
-    if customer_number is not None:
-        SQL = "SELECT DatevKtrNr FROM Kunden WHERE KdNr = %s"
-        mycursor = mydb.cursor()
+    Ledgers that were already imported keep their account numbers, they are
+    only updated by "Reload account numbers".
+    """
+    tmp_file = ACCOUNT_NO_GENERATION_FILE.with_suffix(".tmp")
+    tmp_file.write_text(str(time.time_ns()), encoding="utf-8")
+    os.replace(tmp_file, ACCOUNT_NO_GENERATION_FILE)
+
+
+# account numbers per ("KdNr", customer number) and ("RgNr", invoice ID)
+account_no_cache = AccountNoCache(generation=_account_no_generation)
+
+
+def _customer_account_no(customer_number: str) -> str | None:
+    indexed = account_index.lookup(CUSTOMER, [customer_number])
+    if customer_number in indexed:
+        return indexed[customer_number]
+    return _query_customer_account_no(customer_number)
+
+
+def _query_customer_account_no(customer_number: str) -> str | None:
+    SQL = "SELECT DatevKtrNr FROM Kunden WHERE KdNr = %s"
+    with read_database().cursor() as mycursor:
         mycursor.execute(SQL, (customer_number,))
         result = mycursor.fetchone()
-        if (
-            result
-            and isinstance(result, tuple)
-            and (isinstance(result[0], str) or isinstance(result[0], int))
-            and result[0]
-        ):
-            return str(result[0])
+    if (
+        result
+        and isinstance(result, tuple)
+        and (isinstance(result[0], str) or isinstance(result[0], int))
+        and result[0]
+    ):
+        return str(result[0])
+    return None
+
+
+def _invoice_account_no(invoice_id: str) -> str | None:
+    indexed = account_index.lookup(INVOICE, [invoice_id])
+    if invoice_id in indexed:
+        return indexed[invoice_id]
+    return _query_invoice_account_no(invoice_id)
+
+
+def _query_invoice_account_no(invoice_id: str) -> str | None:
     SQL = """SELECT DatevKtrNr FROM Rechnungen
     JOIN Kunden ON Rechnungen.Kdidx = Kunden.KdIdx
     WHERE RgNr = %s"""
 
-    mycursor = mydb.cursor()
-    mycursor.execute(SQL, (invoice_id,))
-    result = mycursor.fetchone()
+    with read_database().cursor() as mycursor:
+        mycursor.execute(SQL, (invoice_id,))
+        result = mycursor.fetchone()
     if (
         result
         and isinstance(result, tuple)
@@ -55,3 +84,186 @@ def get_datev_account_no(customer_number: str | None, invoice_id: str) -> str |
     ):
         return str(result[0])
     return None
+
+
+def get_datev_account_no(customer_number: str | None, invoice_id: str) -> str | None:
+    if customer_number is not None:
+        account_no = account_no_cache.get_or_retrieve(
+            ("KdNr", customer_number),
+            lambda: _customer_account_no(customer_number),
+        )
+        if account_no is not None:
+            return account_no
+    return account_no_cache.get_or_retrieve(
+        ("RgNr", invoice_id), lambda: _invoice_account_no(invoice_id)
+    )
+
+
+def invalidate_account_no_cache() -> None:
+    """Forget all cached account numbers of this process, see signal_account_no_change for the other processes."""
+    account_no_cache.invalidate()
+
+
+def _account_no(value: object) -> str | None:
+    if (isinstance(value, str) or isinstance(value, int)) and value:
+        return str(value)
+    return None
+
+
+def _normalized_key(value: object) -> str:
+    # how MySQL compares a string with a KdNr/RgNr: trailing spaces and (with
+    # the default _ci collations) the case are ignored, numbers by value
+    key = str(value).strip().casefold()
+    if key.isdigit():
+        key = key.lstrip("0") or "0"
+    return key
+
+
+def _match_rows(
+    keys: list[str],
+    rows: list[tuple[object, object]],
+    query_one: Callable[[str], str | None],
+) -> dict[str, str | None]:
+    """Map the (key, DatevKtrNr) rows of a bulk query to the requested `keys`.
+
+    Rows are matched by the exact string first, then by _normalized_key. Only
+    if rows are left that matched no key, MySQL compared in a way not covered
+    by the normalization and the keys without row are queried with `query_one`.
+    Otherwise the keys without row do not exist and get None.
+    """
+    exact: dict[str, str | None] = {}
+    normalized: dict[str, str | None] = {}
+    for key, account_no in rows:
+        # the first row wins, like fetchone() in get_datev_account_no
+        exact.setdefault(str(key), _account_no(account_no))
+        normalized.setdefault(_normalized_key(key), _account_no(account_no))
+
+    account_nos: dict[str, str | None] = {}
+    missing: list[str] = []
+    for key in keys:
+        if key in exact:
+            account_nos[key] = exact[key]
+        elif _normalized_key(key) in normalized:
+            account_nos[key] = normalized[_normalized_key(key)]
+        else:
+            missing.append(key)
+
+    matched = {_normalized_key(key) for key in account_nos}
+    unmatched_rows = any(key not in matched for key in normalized)
+    for key in missing:
+        account_nos[key] = query_one(key) if unmatched_rows else None
+    return account_nos
+
+
+def _chunks(values: list[str], chunk_size: int) -> Iterator[list[str]]:
+    for i in range(0, len(values), chunk_size):
+        yield values[i : i + chunk_size]
+
+
+def get_datev_account_nos(
+    keys: Iterable[AccountNoKey], chunk_size: int = ACCOUNT_NO_CHUNK_SIZE
+) -> dict[AccountNoKey, str | None]:
+    """Bulk version of get_datev_account_no, with a few chunked IN (...) queries instead of up to two queries per key.
+
+    Like get_datev_account_no the account of the customer number is used if
+    it has one, otherwise the account of the customer of the invoice. Both
+    share account_no_cache, the keys missing in it are looked up in the
+    account index and only the rest is queried. The rows are matched to the
+    keys like MySQL compares them, see _match_rows.
+
+    Args:
+        keys (Iterable[AccountNoKey]): The (customer_number, invoice_id) pairs to look up.
+        chunk_size (int, optional): Maximum number of values per query. Defaults to ACCOUNT_NO_CHUNK_SIZE.
+
+    Returns:
+        dict[AccountNoKey, str | None]: The account number of every key, None if not found.
+
+    """
+    unique_keys = set(keys)
+
+    by_customer: dict[str, str | None] = {}
+    customer_numbers: list[str] = []
+    for customer_number in sorted(
+        {
+            customer_number
+            for customer_number, _ in unique_keys
+            if customer_number is not None
+        }
+    ):
+        found, account_no = account_no_cache.lookup(("KdNr", customer_number))
+        if found:
+            by_customer[customer_number] = account_no
+        else:
+            customer_numbers.append(customer_number)
+    for chunk in _chunks(customer_numbers, chunk_size):
+        indexed = account_index.lookup(CUSTOMER, chunk)
+        for customer_number, account_no in indexed.items():
+            by_customer[customer_number] = account_no
+            account_no_cache.put(("KdNr", customer_number), account_no)
+        chunk = [c for c in chunk if c not in indexed]
+        if not chunk:
+            continue
+        placeholders = ", ".join(["%s"] * len(chunk))
+        sql = f"SELECT KdNr, DatevKtrNr FROM Kunden WHERE KdNr IN ({placeholders})"  # noqa: S608  # nosec
+        with read_database().cursor() as mycursor:
+            mycursor.execute(sql, tuple(chunk))
+            rows = mycursor.fetchall()
+        found_customers = _match_rows(
+            chunk,
+            rows,  # type: ignore[arg-type]
+            _query_customer_account_no,
+        )
+        for customer_number in chunk:
+            # customers without row or account are cached as well
+            account_no = found_customers[customer_number]
+            by_customer[customer_number] = account_no
+            account_no_cache.put(("KdNr", customer_number), account_no)
+
+    by_invoice: dict[str, str | None] = {}
+    invoice_ids: list[str] = []
+    for invoice_id in sorted(
+        {
+            invoice_id
+            for customer_number, invoice_id in unique_keys
+            if customer_number is None or by_customer.get(customer_number) is None
+        }
+    ):
+        found, account_no = account_no_cache.lookup(("RgNr", invoice_id))
+        if found:
+            by_invoice[invoice_id] = account_no
+        else:
+            invoice_ids.append(invoice_id)
+    for chunk in _chunks(invoice_ids, chunk_size):
+        indexed = account_index.lookup(INVOICE, chunk)
+        for invoice_id, account_no in indexed.items():
+            by_invoice[invoice_id] = account_no
+            account_no_cache.put(("RgNr", invoice_id), account_no)
+        chunk = [i for i in chunk if i not in indexed]
+        if not chunk:
+            continue
+        placeholders = ", ".join(["%s"] * len(chunk))
+        sql = f"""SELECT RgNr, DatevKtrNr FROM Rechnungen
+        JOIN Kunden ON Rechnungen.Kdidx = Kunden.KdIdx
+        WHERE RgNr IN ({placeholders})"""  # noqa: S608  # nosec
+        with read_database().cursor() as mycursor:
+            mycursor.execute(sql, tuple(chunk))
+            rows = mycursor.fetchall()
+        found_invoices = _match_rows(
+            chunk,
+            rows,  # type: ignore[arg-type]
+            _query_invoice_account_no,
+        )
+        for invoice_id in chunk:
+            account_no = found_invoices[invoice_id]
+            by_invoice[invoice_id] = account_no
+            account_no_cache.put(("RgNr", invoice_id), account_no)
+
+    account_nos: dict[AccountNoKey, str | None] = {}
+    for customer_number, invoice_id in unique_keys:
+        account_no = None
+        if customer_number is not None:
+            account_no = by_customer.get(customer_number)
+        if account_no is None:
+            account_no = by_invoice.get(invoice_id)
+        account_nos[(customer_number, invoice_id)] = account_no
+    return account_nos
@@ -0,0 +1,221 @@
+"""Lazy, pooled MySQL connections shared by the GUI, the batch CLI and the database scripts.
+
+Nothing connects at import time: the first connection is opened when it is
+first needed, so the app starts without network. The connections use
+autocommit, so every read sees the current data instead of an old REPEATABLE
+READ snapshot; writers open their transaction with start_transaction().
+Connections that were idle for a while are pinged (and reconnected if
+needed) when they are taken from the pool.
+"""
+
+import importlib
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Condition
+from typing import Any, Iterator
+
+CREDENTIALS_FILE = Path(__file__).parent / "database" / "credentials.py"
+
+CREDENTIALS_TEMPLATE = """# connection parameters for mysql.connector.connect()
+DB_CONFIG = {
+    "host": "",
+    "user": "",
+    "password": "",
+    "database": "",
+}
+"""
+
+# the process that imported the credentials module, its legacy `mydb`
+# connection belongs to that process
+_credentials_pid: int | None = None
+
+
+def validate_database_information_exists():
+    # check if this script directory has a subdirectory called database
+    database_dir = CREDENTIALS_FILE.parent
+    if not database_dir.exists():
+        # create database directory
+        database_dir.mkdir()
+
+    # check if credentials.py exists in database directory
+    if not CREDENTIALS_FILE.exists():
+        with open(CREDENTIALS_FILE, "w", encoding="utf-8") as f:
+            f.write(CREDENTIALS_TEMPLATE)
+
+
+class ConnectionProvider:
+    """Small pool of MySQL connections, opened on first use.
+
+    The connection parameters are read from `DB_CONFIG` in
+    converter_app/database/credentials.py. Older credentials files that
+    create a `mydb` connection themselves still work, that connection is
+    then the only one in the pool.
+    """
+
+    def __init__(
+        self, pool_size: int = 4, ping_attempts: int = 3, ping_after: float = 30.0
+    ):
+        """Create the provider, without connecting.
+
+        Args:
+            pool_size (int, optional): Maximum number of open connections, callers wait if all are in use. Defaults to 4.
+            ping_attempts (int, optional): Reconnect attempts for a stale connection. Defaults to 3.
+            ping_after (float, optional): Seconds a connection may be idle before it is pinged when taken from the pool, a round trip per use otherwise. Defaults to 30.0.
+
+        """
+        self.pool_size = pool_size
+        self.ping_attempts = ping_attempts
+        self.ping_after = ping_after
+        self._config: dict[str, Any] | None = None
+        self._legacy_connection: Any = None
+        # idle (connection, time it was returned), the last returned is used first
+        self._idle: list[tuple[Any, float]] = []
+        self._created = 0
+        # notified when a connection is returned or discarded
+        self._available = Condition()
+        self._pid = os.getpid()
+
+    def _load_credentials(self) -> None:
+        global _credentials_pid
+        if self._config is not None or self._legacy_connection is not None:
+            return
+        try:
+            credentials = importlib.import_module("converter_app.database.credentials")
+        except ImportError:
+            validate_database_information_exists()
+            raise
+        if hasattr(credentials, "DB_CONFIG"):
+            self._config = dict(credentials.DB_CONFIG)
+        else:
+            # old credentials file, connected when it was imported
+            if _credentials_pid is not None and _credentials_pid != os.getpid():
+                # imported before a fork, connect again instead of using the
+                # socket of the parent process
+                credentials = importlib.reload(credentials)
+            self._legacy_connection = credentials.mydb
+            self.pool_size = 1
+        _credentials_pid = os.getpid()
+
+    def _connect(self) -> Any:
+        self._load_credentials()
+        if self._legacy_connection is not None:
+            self._legacy_connection.autocommit = True
+            return self._legacy_connection
+
+        import mysql.connector
+
+        config = {**(self._config or {}), "autocommit": True}
+        return mysql.connector.connect(**config)
+
+    def _reset_after_fork(self) -> None:
+        # connections must not be shared with a parent process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._available = Condition()
+            self._idle = []
+            self._created = 0
+            self._legacy_connection = None
+
+    def acquire(self) -> Any:
+        """Take a connection from the pool, connects if none is idle, see connection()."""
+        self._reset_after_fork()
+        idle_since = time.monotonic()
+        with self._available:
+            while True:
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                    break
+                if self._created < self.pool_size:
+                    self._created += 1
+                    connection = None
+                    break
+                # all connections in use, wait until one is returned or discarded
+                self._available.wait()
+
+        if connection is None:
+            try:
+                return self._connect()
+            except Exception:
+                with self._available:
+                    self._created -= 1
+                    self._available.notify()
+                raise
+
+        if time.monotonic() - idle_since >= self.ping_after:
+            # the server may have closed it (wait_timeout), recently used
+            # connections skip the round trip
+            try:
+                connection.ping(reconnect=True, attempts=self.ping_attempts, delay=1)
+            except Exception:
+                self.discard(connection)
+                raise
+        return connection
+
+    def release(self, connection: Any) -> None:
+        """Return a connection taken with acquire() to the pool.
+
+        A transaction left open (started with start_transaction() but neither
+        committed nor rolled back) is rolled back.
+        """
+        if getattr(connection, "in_transaction", False):
+            try:
+                connection.rollback()
+            except Exception:
+                self.discard(connection)
+                return
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def discard(self, connection: Any) -> None:
+        """Close a broken connection taken with acquire() instead of returning it."""
+        with self._available:
+            self._created -= 1
+            if connection is self._legacy_connection:
+                self._legacy_connection = None
+            # a waiting acquire() may connect instead
+            self._available.notify()
+        try:
+            connection.close()
+        except Exception:  # nosec B110
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Use a pooled connection, e.g. for transactions (commit/rollback)."""
+        connection = self.acquire()
+        try:
+            yield connection
+        except BaseException:
+            if not connection.is_connected():
+                self.discard(connection)
+                raise
+            self.release(connection)
+            raise
+        self.release(connection)
+
+    @contextmanager
+    def cursor(self, **kwargs: Any) -> Iterator[Any]:
+        """Use a cursor of a pooled connection, `kwargs` are passed to connection.cursor()."""
+        with self.connection() as connection:
+            cursor = connection.cursor(**kwargs)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._available:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._created -= 1
+                connection.close()
+            self._legacy_connection = None
+            self._available.notify_all()
+
+
+database = ConnectionProvider()
+"""The connection provider of the app, shared by all database users."""
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+import datev_creator
+from converter_app.settings import Settings, settings_file
+from datev_creator.ledger_import import (
+    LedgerImportWMetadata,
+    ledger_import_from_dict,
+    ledger_import_to_dict,
+)
+
+CACHE_FILE = settings_file.parent / "import_cache.sqlite3"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class CacheEntry:
+    """Cached import of one file.
+
+    `xml` and `ledger` are None if the PDF has no embedded invoice XML.
+    The ledgers never contain the bp_account_no, it is looked up after loading.
+    """
+
+    xml: bytes | None
+    ledger: LedgerImportWMetadata | None
+
+
+@cache
+def converter_version() -> str:
+    """Hash of the converter sources, cached imports of other versions are discarded."""
+    digest = hashlib.sha256()
+    for source in sorted(Path(datev_creator.__file__).parent.glob("*.py")):
+        digest.update(source.name.encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class ImportCache:
+    """Persistent cache of extracted and converted invoices, keyed by file content.
+
+    The size and mtime of a file are used to skip hashing files seen before.
+    Entries are evicted least recently used first once the cache exceeds
+    `max_bytes` and are discarded when the converter code or the
+    buchungskonto (which ends up in every ledger) changes.
+    """
+
+    def __init__(
+        self, path: Path = CACHE_FILE, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._namespace: str | None = None
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                digest TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                xml BLOB,
+                ledger TEXT,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            """
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def namespace(self) -> str:
+        """Key of the converter version and settings the cached ledgers were made with."""
+        settings = Settings.getinstance()
+        namespace = hashlib.sha256(
+            f"{converter_version()}:{settings.buchungskonto}:{sorted(settings.bu_codes.items())}".encode()
+        ).hexdigest()
+        if namespace != self._namespace:
+            # settings or code changed, drop everything created with the old ones
+            with self._db:
+                self._db.execute(
+                    "DELETE FROM entries WHERE namespace != ?", (namespace,)
+                )
+            self._namespace = namespace
+        return namespace
+
+    def digest(self, path: Path) -> str:
+        """Content hash of `path`, only re-hashed if size or mtime changed."""
+        stat = path.stat()
+        key = str(path.resolve())
+        row = self._db.execute(
+            "SELECT size, mtime_ns, digest FROM files WHERE path = ?", (key,)
+        ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        digest = file_digest(path)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, digest),
+            )
+        return digest
+
+    def get(self, path: Path) -> CacheEntry | None:
+        """Return the cached import of `path` or None on a cache miss."""
+        digest = self.digest(path)
+        row = self._db.execute(
+            "SELECT xml, ledger FROM entries WHERE digest = ? AND namespace = ?",
+            (digest, self.namespace()),
+        ).fetchone()
+        if row is None:
+            return None
+
+        with self._db:
+            self._db.execute(
+                "UPDATE entries SET last_used = ? WHERE digest = ?",
+                (time.time(), digest),
+            )
+
+        ledger: LedgerImportWMetadata | None = None
+        if row[1] is not None:
+            data = json.loads(row[1])
+            ledger = (
+                ledger_import_from_dict(data["ledger_import"]),
+                (data["year"], data["month"]),
+            )
+        return CacheEntry(xml=row[0], ledger=ledger)
+
+    def put(
+        self, path: Path, xml: bytes | None, ledger: LedgerImportWMetadata | None
+    ) -> None:
+        """Store the import of `path`. Must be called before account numbers are assigned."""
+        ledger_json: str | None = None
+        if ledger is not None:
+            ledger_json = json.dumps(
+                {
+                    "ledger_import": ledger_import_to_dict(ledger[0]),
+                    "year": ledger[1][0],
+                    "month": ledger[1][1],
+                }
+            )
+        size = len(xml or b"") + len(ledger_json or "")
+
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (digest, namespace, xml, ledger, size, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.digest(path),
+                    self.namespace(),
+                    xml,
+                    ledger_json,
+                    size,
+                    time.time(),
+                ),
+            )
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits into max_bytes."""
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        to_delete: list[tuple[str]] = []
+        for digest, size in self._db.execute(
+            "SELECT digest, size FROM entries ORDER BY last_used"
+        ):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((digest,))
+            total -= size
+        with self._db:
+            self._db.executemany("DELETE FROM entries WHERE digest = ?", to_delete)
+
+    def clear(self) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM files")
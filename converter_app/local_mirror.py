@@ -0,0 +1,332 @@
+"""Local SQLite mirror of the Kunden and Rechnungen columns used by the app.
+
+The mirror has the same table and column names as the MySQL database, so
+the account lookups and the database import run the same SQL against it (at
+local disk latency) when `use_local_mirror` is set in settings.json. It is
+also a stand-in database for tests and benchmarks.
+
+Sync with `python -m converter_app sync-mirror`. The rows of every table are
+split into buckets (e.g. 256 customers by KdIdx) and the database is only
+asked for a checksum per bucket, only the rows of buckets whose checksum
+changed since the last sync are transferred.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Iterator, Sequence
+
+from converter_app.db_connection import ConnectionProvider, database
+from converter_app.settings import Settings, settings_file
+
+MIRROR_FILE = settings_file.parent / "local_mirror.sqlite3"
+
+# buckets per query when the rows of changed buckets are fetched
+SYNC_BUCKET_CHUNK_SIZE = 64
+SYNC_FETCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class MirroredTable:
+    """A MySQL table and the columns of it that are mirrored."""
+
+    name: str
+    columns: tuple[str, ...]
+    # SQLite column type per column, the affinity of the MySQL column, so the
+    # mirror compares like MySQL (e.g. KdNr = '01001' finds 1001), TEXT keeps
+    # str() of the MySQL values
+    types: tuple[str, ...]
+    # MySQL expression that assigns every row to a bucket
+    bucket: str
+    indexes: tuple[str, ...]
+
+    @property
+    def checksum_sql(self) -> str:
+        values = ", ".join(f"COALESCE({column}, '<NULL>')" for column in self.columns)
+        return f"""SELECT {self.bucket} AS bucket, COUNT(*), SUM(CRC32(CONCAT_WS('|', {values})))
+        FROM {self.name} GROUP BY bucket"""  # noqa: S608  # nosec
+
+    def rows_sql(self, bucket_count: int) -> str:
+        placeholders = ", ".join(["%s"] * bucket_count)
+        return f"""SELECT {self.bucket}, {", ".join(self.columns)}
+        FROM {self.name} WHERE {self.bucket} IN ({placeholders})"""  # noqa: S608  # nosec
+
+
+KUNDEN = MirroredTable(
+    name="Kunden",
+    columns=("KdIdx", "KdNr", "DatevKtrNr", "KdNme1", "KdOrt"),
+    types=("INTEGER", "INTEGER", "TEXT", "TEXT", "TEXT"),
+    bucket="KdIdx DIV 256",
+    indexes=("KdIdx", "KdNr"),
+)
+RECHNUNGEN = MirroredTable(
+    name="Rechnungen",
+    columns=("RgNr", "RgDat", "RgBrutto", "Par13", "Kdidx"),
+    types=("TEXT", "TEXT", "TEXT", "TEXT", "INTEGER"),
+    # invoice numbers are not sequential, the buckets are spread by hash
+    bucket="CRC32(RgNr) MOD 1024",
+    indexes=("RgNr", "Kdidx", "RgDat"),
+)
+MIRRORED_TABLES = (KUNDEN, RECHNUNGEN)
+
+
+def _sqlite_value(value: Any) -> Any:
+    # Decimal, date and datetime are stored as their str(), like the app reads them
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+class MirrorCursor:
+    """DB-API cursor of the mirror that accepts the MySQL queries of the app.
+
+    The `%s` placeholders are replaced with `?` and, like the MySQL cursor
+    with `dictionary=True`, rows can be returned as dicts.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool = False):
+        self._cursor = cursor
+        if dictionary:
+            self._cursor.row_factory = lambda cursor, row: {
+                column[0]: value
+                for column, value in zip(cursor.description, row, strict=True)
+            }
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def fetchone(self) -> Any:
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int = 1) -> list[Any]:
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self) -> list[Any]:
+        return self._cursor.fetchall()
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class LocalMirror:
+    """The SQLite mirror, opened (and created) on first use.
+
+    cursor() can be used in place of ConnectionProvider.cursor().
+    """
+
+    def __init__(self, path: os.PathLike[str] | str = MIRROR_FILE):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = Lock()
+        self._pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        # other processes keep reading the last sync while a sync is written
+        db.execute("PRAGMA journal_mode=WAL")
+        statements = [
+            """CREATE TABLE IF NOT EXISTS mirror_buckets (
+                table_name TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                PRIMARY KEY (table_name, bucket)
+            )""",
+            """CREATE TABLE IF NOT EXISTS mirror_syncs (
+                table_name TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            )""",
+        ]
+        for table in MIRRORED_TABLES:
+            columns = ", ".join(
+                f"{column} {column_type}"
+                for column, column_type in zip(table.columns, table.types, strict=True)
+            )
+            mirrored_types = tuple(
+                column_type
+                for _, name, column_type, *_ in db.execute(
+                    f"PRAGMA table_info({table.name})"
+                )
+                if name != "mirror_bucket"
+            )
+            if mirrored_types and mirrored_types != table.types:
+                # created by an older version, the next sync pulls every row again
+                statements += [
+                    f"DROP TABLE {table.name}",
+                    f"DELETE FROM mirror_buckets WHERE table_name = '{table.name}'",  # noqa: S608  # nosec
+                    f"DELETE FROM mirror_syncs WHERE table_name = '{table.name}'",  # noqa: S608  # nosec
+                ]
+            statements.append(
+                f"CREATE TABLE IF NOT EXISTS {table.name} (mirror_bucket INTEGER NOT NULL, {columns})"
+            )
+            for column in ("mirror_bucket", *table.indexes):
+                statements.append(
+                    f"CREATE INDEX IF NOT EXISTS {table.name}_{column} ON {table.name} ({column})"
+                )
+        with db:
+            for statement in statements:
+                db.execute(statement)
+        return db
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # sqlite connections must not be shared with a parent process
+            self._pid = os.getpid()
+            self._db = None
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    @contextmanager
+    def cursor(
+        self, dictionary: bool = False, buffered: bool | None = None
+    ) -> Iterator[MirrorCursor]:
+        """Use a cursor of the mirror, see MirrorCursor.
+
+        `buffered` is ignored, SQLite cursors always fetch the rows on demand.
+        """
+        with self._lock:
+            cursor = MirrorCursor(self._connection().cursor(), dictionary=dictionary)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def last_sync(self, table: MirroredTable) -> float | None:
+        """Return the time of the last sync of `table` (seconds since the epoch), None if never synced."""
+        with self.cursor() as cursor:
+            cursor.execute(
+                "SELECT synced_at FROM mirror_syncs WHERE table_name = %s",
+                (table.name,),
+            )
+            row = cursor.fetchone()
+        return None if row is None else float(row[0])
+
+    def sync_table(
+        self, table: MirroredTable, source: ConnectionProvider = database
+    ) -> tuple[int, int]:
+        """Pull the rows of `table` that changed since the last sync from `source`.
+
+        The buckets whose row count or checksum differ from the last sync are
+        replaced, buckets that no longer exist are deleted. The mirror is
+        changed in a single transaction, every fetched batch of rows is
+        inserted as it arrives.
+
+        Args:
+            table (MirroredTable): The table to sync.
+            source (ConnectionProvider, optional): The MySQL database. Defaults to database.
+
+        Returns:
+            tuple[int, int]: The number of changed buckets and the number of pulled rows.
+
+        """
+        with source.cursor() as remote:
+            remote.execute(table.checksum_sql)
+            checksums = {
+                int(bucket): (int(row_count), str(checksum))
+                for bucket, row_count, checksum in remote.fetchall()
+            }
+
+        with self._lock:
+            db = self._connection()
+            synced = {
+                bucket: (row_count, checksum)
+                for bucket, row_count, checksum in db.execute(
+                    "SELECT bucket, row_count, checksum FROM mirror_buckets WHERE table_name = ?",
+                    (table.name,),
+                )
+            }
+        changed = sorted(
+            bucket for bucket, summary in checksums.items() if synced.get(bucket) != summary
+        )
+        removed = sorted(synced.keys() - checksums.keys())
+
+        insert_sql = f"INSERT INTO {table.name} (mirror_bucket, {', '.join(table.columns)}) VALUES ({', '.join(['?'] * (len(table.columns) + 1))})"  # noqa: S608  # nosec
+        row_count = 0
+        with self._lock:
+            db = self._connection()
+            with db:
+                for bucket in (*changed, *removed):
+                    db.execute(
+                        f"DELETE FROM {table.name} WHERE mirror_bucket = ?",  # noqa: S608  # nosec
+                        (bucket,),
+                    )
+                    db.execute(
+                        "DELETE FROM mirror_buckets WHERE table_name = ? AND bucket = ?",
+                        (table.name, bucket),
+                    )
+                for i in range(0, len(changed), SYNC_BUCKET_CHUNK_SIZE):
+                    chunk = changed[i : i + SYNC_BUCKET_CHUNK_SIZE]
+                    with source.cursor() as remote:
+                        remote.execute(table.rows_sql(len(chunk)), tuple(chunk))
+                        while batch := remote.fetchmany(SYNC_FETCH_SIZE):
+                            db.executemany(
+                                insert_sql,
+                                (tuple(map(_sqlite_value, row)) for row in batch),
+                            )
+                            row_count += len(batch)
+                db.executemany(
+                    "INSERT INTO mirror_buckets (table_name, bucket, row_count, checksum) VALUES (?, ?, ?, ?)",
+                    [(table.name, bucket, *checksums[bucket]) for bucket in changed],
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO mirror_syncs (table_name, synced_at) VALUES (?, ?)",
+                    (table.name, time.time()),
+                )
+        return len(changed) + len(removed), row_count
+
+    def clear(self) -> None:
+        """Delete all mirrored rows, the next sync pulls every row again."""
+        with self._lock:
+            db = self._connection()
+            with db:
+                for table in MIRRORED_TABLES:
+                    db.execute(f"DELETE FROM {table.name}")  # noqa: S608  # nosec
+                db.execute("DELETE FROM mirror_buckets")
+                db.execute("DELETE FROM mirror_syncs")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+local_mirror = LocalMirror()
+"""The mirror of the app, in local_mirror.sqlite3 next to settings.json."""
+
+
+def read_database() -> ConnectionProvider | LocalMirror:
+    """Return where Kunden and Rechnungen are read from, the local mirror if `use_local_mirror` is set in the settings."""
+    if Settings.getinstance().use_local_mirror:
+        return local_mirror
+    return database
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m converter_app sync-mirror",
+        description="Pull the changed Kunden and Rechnungen rows into the local mirror.",
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="discard the mirror and pull every row"
+    )
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.full:
+        local_mirror.clear()
+    for table in MIRRORED_TABLES:
+        start = time.perf_counter()
+        buckets, rows = local_mirror.sync_table(table)
+        print(
+            f"{table.name}: {buckets} changed buckets, {rows} rows pulled in {time.perf_counter() - start:.1f}s"
+        )
+    print(f"Mirror: {local_mirror.path}")
+    return 0
@@ -1,38 +1,48 @@
-import tempfile
-from datetime import datetime
+import time
+from datetime import date
 from pathlib import Path
 from tkinter import END, Button, Tk, messagebox
 from tkinter.filedialog import askdirectory, askopenfilename, askopenfilenames
+from tkinter.simpledialog import askstring
 from tkinter.ttk import Treeview
 from typing import cast
 from uuid import uuid4
 
-from pypdf import PdfReader
-
 from converter_app.archive_builder import build_archive_and_save
+from converter_app.batch_import import (
+    find_xml_for_pdf,
+    format_prefilter_summary,
+    import_pdfs_batch,
+    import_xml_file,
+)
+from converter_app.import_cache import ImportCache
 from converter_app.settings import Settings
 from converter_app.xml_inspector import XmlInspector
 from datev_creator.ledger_import import (
     AccountsReceivableLedger,
-    Consolidate,
     LedgerImport,
     LedgerImportWMetadata,
     LedgerImportWMetadataUUID,
 )
-from datev_creator.utils import SOFTWARE_NAME
-from datev_creator.zugfert2ledger_import import (
-    LEDGER_XML_DATA,
-    create_ledgger,
-    zugfert_to_ledger_import,
-)
+from datev_creator.zugfert2ledger_import import assign_bp_account_nos
 
-from .database_retrieve_account_no import get_datev_account_no, mydb
+from .database_import import (
+    import_invoices_by_date,
+    import_invoices_from_database,
+)
+from .database_retrieve_account_no import (
+    account_no_cache,
+    get_datev_account_no,
+    get_datev_account_nos,
+    invalidate_account_no_cache,
+)
 
 
 class App:
     def __init__(self):
         self.pdf_path_list: dict[Path, LedgerImportWMetadata | None] = {}
         self._settings = Settings.getinstance()
+        self._import_cache = ImportCache()
         # tkinter GUI to select a file
         # pdf_path_list = ["a.pdf", "b.pdf"]
 
@@ -101,18 +111,32 @@ class App:
             command=self.import_xmls_from_database,
         )
 
+        button_database_by_date = Button(
+            self.main_window,
+            text="import from database (date range)",
+            command=self.import_invoices_by_date,
+        )
+
         button_save = Button(
             self.main_window,
             text="Save",
             command=self.save,
         )
 
+        button_reload_account_numbers = Button(
+            self.main_window,
+            text="Reload account numbers",
+            command=self.reload_account_numbers,
+        )
+
         import_button.pack(side="left", padx=4, pady=4)
         button_inspect.pack(side="left", padx=4, pady=4)
         import_xml_button.pack(side="left", padx=4, pady=4)
         import_single_xml_button.pack(side="left", padx=4, pady=4)
         button_xml_from_database.pack(side="left", padx=4, pady=4)
+        button_database_by_date.pack(side="left", padx=4, pady=4)
         delete_button.pack(side="left", padx=4, pady=4)
+        button_reload_account_numbers.pack(side="left", padx=4, pady=4)
         button_save.pack(side="left", padx=4, pady=4)
         settings_button.pack(side="right", padx=4, pady=4)
 
@@ -211,162 +235,102 @@ class App:
         self.main_window.mainloop()
 
     def import_xmls_from_database(self) -> None:
-        selected_rgs: list[str] = []
-        for item in self.tree.selection():
-            selected_rgs.append(Path(item).with_suffix("").name.removesuffix("_rg"))
+        selected_pdfs = [Path(item) for item in self.tree.selection()]
 
-        if len(selected_rgs) == 0:
+        if len(selected_pdfs) == 0:
             messagebox.showwarning(
                 "No selection",
                 "Please select at least one PDF to import the XML for.",
             )
             return
 
-        placeholders = ", ".join(["%s"] * len(selected_rgs))
-        sql = f"""
-        SELECT k.DatevKtrNr, k.KdNme1, k.KdOrt, k.KdNr, r.RgNr, r.RgDat, r.RgBrutto, r.Par13
-        FROM Rechnungen r
-        JOIN Kunden k on r.Kdidx = k.KdIdx
-        WHERE r.RgNr IN ({placeholders})
-        """  # noqa: S608  # nosec
-        mycursor = mydb.cursor(dictionary=True)
-        mycursor.execute(sql, tuple(selected_rgs))
-        results = mycursor.fetchall()
-        if not isinstance(results, list) or len(results) == 0:
+        start = time.perf_counter()
+        result = import_invoices_from_database(selected_pdfs)
+        print(
+            f"Imported {len(result.imported)} of {len(selected_pdfs)} invoices from the database in {time.perf_counter() - start:.1f}s"
+        )
+        if len(result.imported) == 0 and len(result.errors) == 0:
             messagebox.showinfo(
                 "No data",
                 "No XML data found in database for the selected PDFs.",
             )
             return
-        seller_tax_id = "DE163738087"
-        for row in results:
-            if not isinstance(row, dict) or len(row) < 7:
-                messagebox.showwarning(
-                    "Data error",
-                    f"Unexpected data format from database: {row}",
-                )
-                continue
-            issue_date_time = str(row["RgDat"])
-            item_amount = str(row["RgBrutto"])
-            buyer_id = str(row["KdNr"])
-            invoice_id = str(row["RgNr"])
-            if str(row["Par13"]) == "0":
-                tax_rate = "19.00"
-                bu_code = "3"
-            else:
-                tax_rate = "0.00"
-                bu_code = "200"
-            account_no_retrieval = get_datev_account_no
-            ship_from_country = "DE"
-            ship_to_country = "DE"
-            due_date = None
-            delivery_date = None
-            order_id = None
-            information_text = f"Ausgangsrechnung {invoice_id}"
-            buyer_name: str = cast(str, row["KdNme1"])
-            booking_text = buyer_name
-            buyer_city = cast(str, row["KdOrt"])
-
-            ledger_import_xml = LedgerImport(
-                generator_info="Bombelczyk Aufzüge",
-                xml_data=LEDGER_XML_DATA,
-                consolidate=Consolidate(
-                    # find document reference in /home/silas/Documents/coding/python/datev/.venv/lib/python3.13/site-packages/drafthorse/models/*
-                    consolidated_amount=str(item_amount),
-                    #             ExchangedDocument
-                    # IssueDateTime
-                    # DateTimeString
-                    consolidated_date=issue_date_time,
-                    consolidated_currency_code="EUR",
-                    ledgers=[
-                        create_ledgger(
-                            issue_date_time=issue_date_time,
-                            currency_code="EUR",
-                            buyer_name=buyer_name,
-                            buyer_city=buyer_city,
-                            bp_account_no_retrieval=account_no_retrieval,
-                            item_amount=item_amount,
-                            buyer_id=buyer_id,
-                            invoice_id=invoice_id,
-                            bu_code=bu_code,
-                            tax_rate=tax_rate,
-                            seller_tax_id=seller_tax_id,
-                            ship_from_country=ship_from_country,
-                            buyer_tax_id=None,
-                            ship_to_country=ship_to_country,
-                            due_date=due_date,
-                            delivery_date=delivery_date,
-                            order_id=order_id,
-                            information_text=information_text,
-                            booking_text=booking_text,
-                        )
-                    ],
-                    consolidated_invoice_id=invoice_id,
-                    consolidated_delivery_date=None,
-                    consolidated_order_id=None,
+        if len(result.errors) > 0:
+            messagebox.showwarning(
+                "Data error",
+                "\n".join(result.errors[:20])
+                + (
+                    f"\n... and {len(result.errors) - 20} more"
+                    if len(result.errors) > 20
+                    else ""
                 ),
-                generating_system=SOFTWARE_NAME,
             )
-            saved = False
-            for item in self.tree.selection():
-                pdf_path = Path(item)
-                rg_nr = pdf_path.with_suffix("").name.removesuffix("_rg")
-                if rg_nr == str(row["RgNr"]):
-                    self.pdf_path_list[pdf_path] = (
-                        ledger_import_xml,
-                        datetime.strptime(issue_date_time, "%Y-%m-%d").timetuple()[0:2],
-                    )
-                    saved = True
-                    break
-            if not saved:
-                messagebox.showwarning(
-                    "Could not save",
-                    "Could not save document: " + str(row["RgNr"]),
-                )
-                continue
+        self.pdf_path_list.update(result.imported)
         self.update_treeview()
 
-    @staticmethod
-    def extract_xml_from_pdf(pdf: Path) -> Path | None:
-        file_name = pdf.name
-        # pdf = Path(file_name)
-        reader = PdfReader(pdf)
-        attachments = {}
-
-        catalog = reader.trailer["/Root"]
-        print(catalog)
-        if "/Names" in catalog and "/EmbeddedFiles" in catalog["/Names"]:
-            fileNames = catalog["/Names"]["/EmbeddedFiles"]["/Names"]
-            for f in fileNames:
-                print(f)
-                if isinstance(f, str) and f == "factur-x.xml":
-                    name = f
-                    dataIndex = fileNames.index(f) + 1
-                    fDict = fileNames[dataIndex].get_object()
-                    fData = fDict["/EF"]["/F"].get_data()
-                    attachments[name] = fData
-
-                    tempdir_path = Path(tempfile.gettempdir()) / (file_name + ".xml")
-                    with open(tempdir_path, "wb") as xml_file:
-                        xml_file.write(fData)
-                    return tempdir_path
-        return None
-
-    @staticmethod
-    def import_x_rechnung(pdf: Path) -> LedgerImportWMetadata | None:
-        print(f"Importing {pdf}")
-        if not pdf.exists() or not pdf.is_file():
-            messagebox.showerror(
-                "File Error", f"The file {pdf} does not exist or is not a file."
+    def import_invoices_by_date(self) -> None:
+        """Import all invoices of a date range from the database, with the matching PDFs of the PDF folder."""
+        today = date.today()
+        first_day_text = askstring(
+            "Import from database",
+            "First invoice date (YYYY-MM-DD):",
+            initialvalue=today.replace(day=1).isoformat(),
+        )
+        if first_day_text is None:
+            return
+        last_day_text = askstring(
+            "Import from database",
+            "Last invoice date (YYYY-MM-DD):",
+            initialvalue=today.isoformat(),
+        )
+        if last_day_text is None:
+            return
+        try:
+            first_day = date.fromisoformat(first_day_text.strip())
+            last_day = date.fromisoformat(last_day_text.strip())
+        except ValueError as e:
+            messagebox.showwarning("Invalid date", str(e))
+            return
+
+        start = time.perf_counter()
+        result = import_invoices_by_date(first_day, last_day, self._settings.pdf_path)
+        print(
+            f"Imported {len(result.imported)} invoices from {first_day} to {last_day} from the database in {time.perf_counter() - start:.1f}s"
+        )
+        problems = result.errors + [
+            f"No PDF for invoice {invoice_id}" for invoice_id in result.missing_pdfs
+        ]
+        if len(result.imported) == 0 and len(problems) == 0:
+            messagebox.showinfo(
+                "No data",
+                f"No invoices found in the database from {first_day} to {last_day}.",
+            )
+            return
+        if len(problems) > 0:
+            messagebox.showwarning(
+                "Import incomplete",
+                "\n".join(problems[:20])
+                + (
+                    f"\n... and {len(problems) - 20} more"
+                    if len(problems) > 20
+                    else ""
+                ),
             )
-            return None
+        self.pdf_path_list.update(result.imported)
+        self.update_treeview()
 
-        xml_path = App.extract_xml_from_pdf(pdf)
-        print(f"Extracted XML path: {xml_path}")
-        if xml_path is not None and xml_path.exists():
-            return zugfert_to_ledger_import(xml_path, get_datev_account_no)
+    def reload_account_numbers(self) -> None:
+        """Look up the missing account numbers again, bypassing the account number cache.
 
-        return None
+        E.g. after the accounts were fixed with database_kunden_new_konto_nr.py.
+        """
+        invalidate_account_no_cache()
+        assign_bp_account_nos(
+            [ledger[0] for ledger in self.pdf_path_list.values() if ledger is not None],
+            get_datev_account_nos,
+        )
+        print(f"Account number cache: {account_no_cache.stats()}")
+        self.update_treeview()
 
     def import_pdfs(self) -> None:
         pdf_paths = askopenfilenames(
@@ -379,17 +343,37 @@ class App:
         if len(pdf_paths) == 0:
             messagebox.showinfo("No files selected", "No PDF files were selected.")
             return
-        # imported_pdfs: dict[Path, LedgerImportWMetadata | None] = {}
+        new_pdfs: list[Path] = []
         for pdf in pdf_paths:
             pdf_path = Path(pdf)
-            if pdf_path in self.pdf_path_list:
+            if pdf_path in self.pdf_path_list or pdf_path in new_pdfs:
                 messagebox.showwarning(
                     "Duplicate file",
                     f"The file {pdf_path.name} has already been imported. Skipping.",
                 )
                 continue
-            # process the PDF file (placeholder for actual processing logic)
-            self.pdf_path_list[pdf_path] = self.import_x_rechnung(pdf_path)
+            new_pdfs.append(pdf_path)
+
+        failed: list[str] = []
+        results = import_pdfs_batch(
+            new_pdfs,
+            cache=self._import_cache,
+            bp_account_nos_retrieval=get_datev_account_nos,
+        )
+        for result in results:
+            self.pdf_path_list[result.pdf] = result.ledger
+            if result.error is not None:
+                failed.append(f"{result.pdf.name}: {result.error}")
+
+        prefilter_message = format_prefilter_summary(results)
+        if prefilter_message is not None:
+            print(prefilter_message)
+
+        if len(failed) > 0:
+            messagebox.showwarning(
+                "Import errors",
+                "The following PDFs could not be imported:\n" + "\n".join(failed),
+            )
 
         self.update_treeview()
 
@@ -426,8 +410,8 @@ class App:
             )
             return
 
-        self.pdf_path_list[selected_pdf] = zugfert_to_ledger_import(
-            xml_path, get_datev_account_no
+        self.pdf_path_list[selected_pdf] = import_xml_file(
+            xml_path, get_datev_account_no, self._import_cache
         )
         self.update_treeview()
 
@@ -457,18 +441,18 @@ class App:
             return
 
         missing_xmls = []
+        imported: list[LedgerImport] = []
 
         for pdf in missing_xml:
-            xml_file = xml_folder / (pdf.stem + ".xml")
-            if not xml_file.exists():
-                xml_file = xml_folder / (pdf.stem + "_rg" + ".xml")
-
-            if not xml_file.exists() or not xml_file.is_file():
+            xml_file = find_xml_for_pdf(pdf, xml_folder)
+            if xml_file is None:
                 missing_xmls.append(pdf.stem)
                 continue
-            self.pdf_path_list[pdf] = zugfert_to_ledger_import(
-                xml_file, get_datev_account_no
-            )
+            ledger = import_xml_file(xml_file, cache=self._import_cache)
+            self.pdf_path_list[pdf] = ledger
+            imported.append(ledger[0])
+        # one lookup for all XML files instead of one per file
+        assign_bp_account_nos(imported, get_datev_account_nos)
 
         if len(missing_xmls) > 0:
             file_str = ", ".join(f"({f}.xml {f}_rg.xml)" for f in missing_xmls)
@@ -1,14 +1,19 @@
 import json
 from dataclasses import dataclass
 from pathlib import Path
-from tkinter import Button, Entry, Label, Tk, filedialog
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from tkinter import Label
 
 settings_file = Path(__file__).parent.parent / "settings.json"
 
 
 settings_instance: Optional["Settings"] = None
 
+# BU code (Buchungsschlüssel) per tax rate, the rates are formatted like the ledger tax ("19.00")
+DEFAULT_BU_CODES = {"19.00": "3", "0.00": "200"}
+
 
 @dataclass
 class Settings:
@@ -18,6 +23,9 @@ class Settings:
     mandantennummer: int = 0
     sachkontenlaenge = 4
     buchungskonto = 0
+    bu_codes = DEFAULT_BU_CODES
+    # read Kunden and Rechnungen from the local mirror (python -m converter_app sync-mirror)
+    use_local_mirror = False
 
     def check_csv_settings(self) -> bool:
         if self.beraternummer <= 0:
@@ -42,23 +50,36 @@ class Settings:
             self.save()
         with open(settings_file, encoding="utf-8") as f:
             data = json.load(f)
+            # bypass __setattr__, loading must not rewrite the file (import workers load it concurrently)
+            set_attr = super().__setattr__
             for key, value in data.items():
                 match key:
                     case "pdf_path":
-                        self.pdf_path = Path(value)
+                        set_attr("pdf_path", Path(value))
                     case "xml_folder":
-                        self.xml_folder = Path(value)
+                        set_attr("xml_folder", Path(value))
                     case "beraternummer":
-                        self.beraternummer = int(value)
+                        set_attr("beraternummer", int(value))
                     case "mandantennummer":
-                        self.mandantennummer = int(value)
+                        set_attr("mandantennummer", int(value))
                     case "sachkontenlaenge":
-                        self.sachkontenlaenge = int(value)
+                        set_attr("sachkontenlaenge", int(value))
                     case "buchungskonto":
-                        self.buchungskonto = int(value)
+                        set_attr("buchungskonto", int(value))
+                    case "bu_codes":
+                        set_attr(
+                            "bu_codes",
+                            {
+                                f"{float(rate):.2f}": str(bu_code)
+                                for rate, bu_code in value.items()
+                            },
+                        )
+                    case "use_local_mirror":
+                        set_attr("use_local_mirror", bool(value))
 
     def __init__(self):
         super().__init__()
+        super().__setattr__("bu_codes", dict(DEFAULT_BU_CODES))
         self.load_json()
 
     def save(self):
@@ -70,6 +91,8 @@ class Settings:
                 "mandantennummer": self.mandantennummer,
                 "sachkontenlaenge": self.sachkontenlaenge,
                 "buchungskonto": self.buchungskonto,
+                "bu_codes": self.bu_codes,
+                "use_local_mirror": self.use_local_mirror,
             }
             json.dump(to_save, f, indent=4)
 
@@ -78,6 +101,9 @@ class Settings:
         self.save()
 
     def open_tk_settings_dialoge(self):
+        # tkinter is only imported here, the batch CLI must run without a display
+        from tkinter import Button, Entry, Label, Tk
+
         window = Tk()
         window.title("Settings")
         window.geometry("300x200")
@@ -153,14 +179,18 @@ class Settings:
 
         window.mainloop()
 
-    def change_pdf_path(self, label: Label):
+    def change_pdf_path(self, label: "Label"):
+        from tkinter import filedialog
+
         new_path = filedialog.askdirectory()
         if new_path:
             self.pdf_path = Path(new_path)
             label.config(text=f"PDF Path: {self.pdf_path}")
             self.save()
 
-    def change_xml_folder(self, label: Label):
+    def change_xml_folder(self, label: "Label"):
+        from tkinter import filedialog
+
         new_path = filedialog.askdirectory()
         if new_path:
             self.xml_folder = Path(new_path)
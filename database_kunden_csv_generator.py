@@ -1,11 +1,20 @@
-import csv
-from collections.abc import Iterable
+import argparse
+import hashlib
+import json
+import os
+from collections.abc import Iterable, Iterator
 from datetime import datetime
-from io import StringIO
-from tkinter.filedialog import asksaveasfilename
-from typing import TypedDict
+from pathlib import Path
+from typing import Any, TypedDict
 
-from converter_app.database_retrieve_account_no import mydb
+from converter_app.db_connection import database
+from converter_app.settings import settings_file
+from datev_creator.datev_encoding import open_datev_csv
+
+# digest of every exported row, per customer, see build_csv(delta=True)
+EXPORT_STATE_FILE = settings_file.parent / "kunden_export_state.json"
+# rows per fetchmany() call
+FETCH_SIZE = 1000
 
 now = datetime.now()
 # YYYYMMDDHHMMSSFFF
@@ -220,114 +229,221 @@ CSV_HEADER_LIST = [
 ]
 
 
-def build_csv_data(data: Iterable[DBData]) -> str:
-    csv_buffer = StringIO()
-    writer = csv.DictWriter(
-        csv_buffer,
-        fieldnames=CSV_HEADER_LIST,
-        delimiter=";",
-        quotechar='"',
-        quoting=csv.QUOTE_NONNUMERIC,
-        lineterminator="\r\n",
-    )
-    writer.writeheader()
+def _quote(value: str | int | None) -> str:
+    # like csv.writer with QUOTE_NONNUMERIC, None is written as an empty string
+    if value is None:
+        return '""'
+    if isinstance(value, int):
+        return str(value)
+    return '"' + value.replace('"', '""') + '"'
 
-    for entry in data:
-        konto_nr = entry.get("konto_nr", "")
-        name = entry.get("name", "")
-        kurzbezeichnung = name[:15]
-        kundennr = entry.get("kundennr", "")
-        street = entry.get("street", "")
-        postal_code = entry.get("postal_code", "")
-        if postal_code:
-            postal_code = postal_code.zfill(5)
 
-        city = entry.get("city", "")
-        country = "DE"
+# the filled columns, in column order
+_FILLED_COLUMNS = [
+    "Konto",
+    "Name (Adressattyp Unternehmen)",
+    "Kurzbezeichnung",
+    "Straße",
+    "Postleitzahl",
+    "Ort",
+    "Land",
+    "Kunden-/Lief.-Nr.",
+]
 
-        csv_dict: dict[str, str | int | None] = {val: "" for val in CSV_HEADER_LIST}
-        csv_dict["Konto"] = konto_nr
-        csv_dict["Name (Adressattyp Unternehmen)"] = name
-        csv_dict["Kurzbezeichnung"] = kurzbezeichnung
-        csv_dict["Kunden-/Lief.-Nr."] = kundennr
-        csv_dict["Straße"] = street
-        csv_dict["Postleitzahl"] = postal_code
-        csv_dict["Ort"] = city
-        csv_dict["Land"] = country
 
-        writer.writerow(csv_dict)
+def _row_template() -> list[str]:
+    # the constant text before, between and after the filled columns
+    indexes = [CSV_HEADER_LIST.index(column) for column in _FILLED_COLUMNS]
+    if indexes != sorted(indexes):
+        raise ValueError("_FILLED_COLUMNS must be in the order of CSV_HEADER_LIST")
+    template = []
+    previous = -1
+    for index in indexes:
+        separator = ";" if previous >= 0 else ""
+        template.append(separator + '"";' * (index - previous - 1))
+        previous = index
+    template.append(';""' * (len(CSV_HEADER_LIST) - previous - 1) + "\r\n")
+    return template
 
-    return csv_buffer.getvalue()
 
+_ROW_TEMPLATE = _row_template()
+CSV_HEADER_ROW = ";".join(map(_quote, CSV_HEADER_LIST)) + "\r\n"
 
-def database_get_entries() -> list[DBData]:
-    cursor = mydb.cursor(dictionary=True)
-    cursor.execute(
-        "SELECT KdNr, KdNme1, KdNme2, KdStr, KdPlz, KdOrt, DatevKtrNr FROM Kunden"
+
+def csv_row(entry: DBData) -> str:
+    """The CSV line of `entry`, the same as written by csv.writer with QUOTE_NONNUMERIC.
+
+    Only the filled columns are formatted, the empty columns in between are
+    constant text of _ROW_TEMPLATE.
+    """
+    name = entry.get("name", "")
+    postal_code = entry.get("postal_code", "")
+    if postal_code:
+        postal_code = postal_code.zfill(5)
+
+    t = _ROW_TEMPLATE
+    return "".join(
+        (
+            t[0],
+            _quote(entry.get("konto_nr", "")),
+            t[1],
+            _quote(name),
+            t[2],
+            _quote(name[:15]),
+            t[3],
+            _quote(entry.get("street", "")),
+            t[4],
+            _quote(postal_code),
+            t[5],
+            _quote(entry.get("city", "")),
+            t[6],
+            '"DE"',
+            t[7],
+            _quote(entry.get("kundennr", "")),
+            t[8],
+        )
     )
-    results = cursor.fetchall()
-    data_list: list[DBData] = []
-    for row in results:
-        kundennr = str(row["KdNr"])
-        name1 = str(row["KdNme1"])
-        name2 = str(row["KdNme2"])
-        name = name1
-        if name2:
-            name += " " + name2
-
-        name = name[:50]
-
-        street = str(row["KdStr"]) or ""
-        postal_code = str(row["KdPlz"]) or ""
-        city = str(row["KdOrt"]) or ""
-        konto_nr = int(row["DatevKtrNr"])
-
-        data_list.append(
-            {
-                "konto_nr": konto_nr or None,
-                "name": name,
-                "kundennr": kundennr,
-                "street": street,
-                "postal_code": postal_code,
-                "city": city,
-                "country": "DE",
-            }
+
+
+def build_csv_data(data: Iterable[DBData]) -> str:
+    return CSV_HEADER_ROW + "".join(map(csv_row, data))
+
+
+def _entry_from_row(row: dict[str, Any]) -> DBData:
+    kundennr = str(row["KdNr"])
+    name1 = str(row["KdNme1"])
+    name2 = str(row["KdNme2"])
+    name = name1
+    if name2:
+        name += " " + name2
+
+    name = name[:50]
+
+    street = str(row["KdStr"]) or ""
+    postal_code = str(row["KdPlz"]) or ""
+    city = str(row["KdOrt"]) or ""
+    konto_nr = int(row["DatevKtrNr"])
+
+    return {
+        "konto_nr": konto_nr or None,
+        "name": name,
+        "kundennr": kundennr,
+        "street": street,
+        "postal_code": postal_code,
+        "city": city,
+        "country": "DE",
+    }
+
+
+def iter_database_entries(fetch_size: int = FETCH_SIZE) -> Iterator[DBData]:
+    """Stream the customers from an unbuffered (server-side) cursor, `fetch_size` rows at a time."""
+    with database.cursor(dictionary=True, buffered=False) as cursor:
+        cursor.execute(
+            "SELECT KdNr, KdNme1, KdNme2, KdStr, KdPlz, KdOrt, DatevKtrNr FROM Kunden"
         )
-    return data_list
+        while rows := cursor.fetchmany(fetch_size):
+            for row in rows:
+                yield _entry_from_row(row)
 
 
-def build_csv(file_path: str) -> None:
-    data = database_get_entries() + DEFAULT_KTR_DB_DATA
-    # Western-1 encoding
-    with open(file_path, "w", encoding="iso-8859-1", newline="") as f:
-        f.write(HEADER_LINE + "\r\n")
+def database_get_entries() -> list[DBData]:
+    return list(iter_database_entries())
+
+
+def _entry_key(entry: DBData) -> str:
+    # the default accounts have no customer number
+    return entry["kundennr"] or f"default:{entry['name']}"
+
+
+def _entry_digest(entry: DBData) -> str:
+    return hashlib.sha256(
+        json.dumps(entry, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def load_export_state(state_file: Path = EXPORT_STATE_FILE) -> dict[str, str]:
+    if not state_file.exists():
+        return {}
+    with open(state_file, encoding="utf-8") as f:
+        return json.load(f)
+
 
-        data_str = build_csv_data(data)
-        # get chars not encodable in iso-8859-1
-        try:
-            data_str.encode("iso-8859-1")
-        except UnicodeEncodeError as e:
-            print(
-                f"Warning: Some characters could not be encoded in ISO-8859-1: {e}. They will be replaced with '?'."
-            )
+def save_export_state(state: dict[str, str], state_file: Path = EXPORT_STATE_FILE):
+    # replaced at once, an aborted export keeps the previous state
+    tmp_file = state_file.with_suffix(".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
 
-            for idx, char in enumerate(data_str):
-                try:
-                    char.encode("iso-8859-1")
-                except UnicodeEncodeError:
-                    print(f" - Position {idx}: '{char}' (U+{ord(char):04X})")
-                    print(data_str[max(0, idx - 20) : idx + 20])
 
-        f.write(data_str)
+def build_csv(
+    file_path: str, delta: bool = False, state_file: Path = EXPORT_STATE_FILE
+) -> int:
+    """Write the Debitoren/Kreditoren CSV, the rows are written as they are read from the database.
+
+    Every export records a digest of each row in `state_file`. With `delta`
+    only the customers that are new or changed since the last recorded
+    export are written.
+
+    Args:
+        file_path (str): The CSV file to write.
+        delta (bool, optional): Only export new and changed customers. Defaults to False.
+        state_file (Path, optional): The state of the last export. Defaults to EXPORT_STATE_FILE.
+
+    Returns:
+        int: The number of exported customers.
+
+    """
+    previous_state = load_export_state(state_file) if delta else {}
+    state: dict[str, str] = {}
+    count = 0
+    # Western-1 encoding, characters outside of it are transliterated
+    with open_datev_csv(file_path, newline="") as f:
+        f.write(HEADER_LINE + "\r\n")
+        f.write(CSV_HEADER_ROW)
+
+        for entries in (iter_database_entries(), DEFAULT_KTR_DB_DATA):
+            for entry in entries:
+                key = _entry_key(entry)
+                digest = _entry_digest(entry)
+                state[key] = digest
+                if previous_state.get(key) == digest:
+                    continue
+                f.record = key
+                f.write(csv_row(entry))
+                count += 1
+    if len(f.report) > 0:
+        print(f"Warning: {f.report.summary()}")
+
+    save_export_state(state, state_file)
+    return count
 
 
 if __name__ == "__main__":
-    filename = asksaveasfilename(
-        defaultextension=".csv",
-        filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-        title="Save CSV file",
-        initialfile=f"kunden_{timestamp}.csv",
+    parser = argparse.ArgumentParser(
+        description="Export the customers as DATEV Debitoren/Kreditoren CSV."
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="only export customers created or changed since the last export",
+    )
+    parser.add_argument(
+        "--output", help="CSV file to write, asked for in a dialog if not given"
     )
+    args = parser.parse_args()
+
+    filename = args.output
+    if filename is None:
+        from tkinter.filedialog import asksaveasfilename
+
+        filename = asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            title="Save CSV file",
+            initialfile=f"kunden_{timestamp}.csv",
+        )
 
     if filename:
-        build_csv(filename)
+        exported = build_csv(filename, delta=args.delta)
+        print(f"Exported {exported} customers to {filename}")
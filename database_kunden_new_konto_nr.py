@@ -1,25 +1,198 @@
+"""Reconcile the account numbers (Konto) of a DATEV Debitoren export with Kunden.DatevKtrNr.
+
+Without --apply only a report is printed (dry run). With --apply the
+customers without account number in the database get the one of the CSV,
+all in one transaction. Differing account numbers are only reported.
+"""
+
 import argparse
 import csv
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 from pathlib import Path
 
-# from database_kunden_csv_generator import CSV_HEADER_LIST
-from converter_app.database_retrieve_account_no import mydb
+from converter_app.database_retrieve_account_no import signal_account_no_change
+from converter_app.db_connection import ConnectionProvider, database
+from converter_app.local_mirror import KUNDEN, local_mirror
 
 KDR_NR = "Kundennummer"
 KONTO_NR = "Konto"
 
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Generate a CSV file for customer accounts from the database."
+# customer numbers per IN (...) query
+CHUNK_SIZE = 500
+
+UPDATE_SQL = "UPDATE Kunden SET DatevKtrNr = %s WHERE KdNr = %s"
+
+
+@dataclass
+class Reconciliation:
+    """Diff of the CSV and the database, the tuples are (KdNr, Konto CSV[, Konto DB])."""
+
+    csv_count: int = 0
+    database_count: int = 0
+    matching: int = 0
+    not_in_database: list[tuple[str, str]] = field(default_factory=list)
+    missing: list[tuple[str, str]] = field(default_factory=list)
+    differing: list[tuple[str, str, str]] = field(default_factory=list)
+
+    @property
+    def conflicts(self) -> int:
+        return len(self.not_in_database) + len(self.missing) + len(self.differing)
+
+
+def iter_csv_accounts(path: Path) -> Iterator[tuple[str, str]]:
+    """Stream the (Kundennummer, Konto) pairs of a DATEV Debitoren CSV, rows without either are skipped."""
+    with open(path, encoding="latin-1", newline="") as f:
+        # the first line is the DATEV header, the column names follow
+        next(f, None)
+        for row in csv.DictReader(f, delimiter=";"):
+            kd_nr = str(row[KDR_NR] or "")
+            konto_nr = str(row[KONTO_NR] or "")
+            if kd_nr.strip() and konto_nr.strip():
+                yield kd_nr, konto_nr
+
+
+def _chunks(values: list[str], chunk_size: int) -> Iterator[list[str]]:
+    for i in range(0, len(values), chunk_size):
+        yield values[i : i + chunk_size]
+
+
+def reconcile(
+    csv_accounts: Iterable[tuple[str, str]],
+    source: ConnectionProvider = database,
+    chunk_size: int = CHUNK_SIZE,
+) -> Reconciliation:
+    """Compare the account numbers of the CSV with the database.
+
+    The CSV pairs are hashed by customer number (the last row of a customer
+    wins), then the database is queried in chunks of `chunk_size` customer
+    numbers and each chunk is joined against the hash table.
+
+    Args:
+        csv_accounts (Iterable[tuple[str, str]]): The (Kundennummer, Konto) pairs, see iter_csv_accounts.
+        source (ConnectionProvider, optional): The database. Defaults to database.
+        chunk_size (int, optional): Maximum number of customer numbers per query. Defaults to CHUNK_SIZE.
+
+    Returns:
+        Reconciliation: The customers with matching, missing and differing account numbers.
+
+    """
+    csv_data = dict(csv_accounts)
+    result = Reconciliation(csv_count=len(csv_data))
+
+    for chunk in _chunks(list(csv_data), chunk_size):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        sql = f"SELECT KdNr, DatevKtrNr FROM Kunden WHERE KdNr IN ({placeholders})"  # noqa: S608  # nosec
+        with source.cursor(dictionary=True) as cursor:
+            cursor.execute(sql, tuple(chunk))
+            rows = cursor.fetchall()
+        database_data: dict[str, str] = {}
+        for row in rows:
+            account_no = row["DatevKtrNr"]
+            database_data[str(row["KdNr"])] = (
+                "" if account_no is None else str(account_no)
+            )
+        result.database_count += len(database_data)
+
+        for kd_nr in chunk:
+            konto_nr_csv = csv_data[kd_nr]
+            konto_nr_db = database_data.get(kd_nr)
+            if konto_nr_csv == konto_nr_db:
+                result.matching += 1
+            elif konto_nr_db is None:
+                result.not_in_database.append((kd_nr, konto_nr_csv))
+            elif not konto_nr_db.strip().strip("0"):
+                result.missing.append((kd_nr, konto_nr_csv))
+            else:
+                result.differing.append((kd_nr, konto_nr_csv, konto_nr_db))
+    return result
+
+
+def print_report(result: Reconciliation) -> None:
+    print(
+        f"found {result.csv_count} complete (kdnr + kontoNR) entries in the CSV file. {result.database_count} entries found in the database.\n"
     )
+    for kd_nr, _ in result.not_in_database:
+        print(f"Kunde {kd_nr} is not in database but has a konto nr in the CSV.")
+    for kd_nr, konto_nr_csv in result.missing:
+        print(
+            f"Missing account number for customer number {kd_nr} in database. CSV Konto Nr: {konto_nr_csv}"
+        )
+    for kd_nr, konto_nr_csv, konto_nr_db in result.differing:
+        print(
+            f"Kundennummer: {kd_nr}, Konto Nr differ: Konto Nr CSV: {konto_nr_csv}, Konto Nr DB: {konto_nr_db}"
+        )
+    print(
+        f"\n{result.matching} matching, {len(result.missing)} missing, {len(result.differing)} differing, {len(result.not_in_database)} not in the database."
+    )
+
+
+def write_report(result: Reconciliation, path: Path) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["KdNr", "Status", "Konto CSV", "Konto DB"])
+        for kd_nr, konto_nr_csv in result.not_in_database:
+            writer.writerow([kd_nr, "not in database", konto_nr_csv, ""])
+        for kd_nr, konto_nr_csv in result.missing:
+            writer.writerow([kd_nr, "missing", konto_nr_csv, ""])
+        for kd_nr, konto_nr_csv, konto_nr_db in result.differing:
+            writer.writerow([kd_nr, "differing", konto_nr_csv, konto_nr_db])
+
+
+def apply_fixes(
+    fixes: list[tuple[str, str]], source: ConnectionProvider = database
+) -> None:
+    """Set the account numbers of the (KdNr, Konto) `fixes` with one executemany() in a single transaction.
+
+    Rolls back all updates if one fails. Afterwards running converters are
+    signalled to drop their cached account numbers (see
+    signal_account_no_change) and the Kunden table of the local mirror (if
+    used) is synced. Invoices already imported in a converter keep their
+    account numbers until "Reload account numbers" is used there.
+    """
+    if not fixes:
+        return
+    with source.connection() as connection:
+        # pooled connections use autocommit, the updates are one transaction
+        connection.start_transaction()
+        cursor = connection.cursor()
+        try:
+            cursor.executemany(
+                UPDATE_SQL, [(konto_nr, kd_nr) for kd_nr, konto_nr in fixes]
+            )
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    signal_account_no_change()
+    if Path(local_mirror.path).exists():
+        buckets, rows = local_mirror.sync_table(KUNDEN, source)
+        print(f"Local mirror: {buckets} changed buckets, {rows} rows pulled")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
     parser.add_argument(
         "file",
         type=str,
-        help="Path to the output CSV file.",
+        help="Path to the DATEV Debitoren CSV file.",
         nargs="?",
         default="",
     )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="write the missing account numbers to the database",
+    )
+    parser.add_argument(
+        "--report", type=Path, help="also write the differences to this CSV file"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="customers per query"
+    )
     args = parser.parse_args()
     input_file = args.file
     if not input_file:
@@ -28,62 +201,31 @@ if __name__ == "__main__":
     input_file_path = Path(input_file)
     if not input_file_path.is_file():
         print(f"The file {input_file} does not exist.")
-        exit(1)
-
-    with open(input_file_path, encoding="latin-1") as f:
-        csv_reader = csv.DictReader(f.readlines()[1:], delimiter=";")
-
-        csv_data: dict[str, str] = {
-            str(k[KDR_NR]): str(k[KONTO_NR])
-            for k in csv_reader
-            if k[KDR_NR].strip() and k[KONTO_NR].strip()
-        }
-
-    cursor = mydb.cursor(dictionary=True)
-    sql = f"SELECT KdNr, DatevKtrNr FROM Kunden WHERE KdNr in ({', '.join(['%s'] * len(csv_data))})"  # noqa: S608 # nosec
-    cursor.execute(sql, [s for s in csv_data])
-    results = cursor.fetchall()
-
-    database_data = dict[str, str]()
+        return 1
 
-    for row in results:
-        database_data[str(row["KdNr"])] = str(row["DatevKtrNr"])
+    result = reconcile(iter_csv_accounts(input_file_path), chunk_size=args.chunk_size)
+    print_report(result)
+    if args.report is not None:
+        write_report(result, args.report)
+        print(f"Report written to {args.report}")
 
-    merged_data = {
-        kdnr: (csv_data[kdnr], database_data.get(kdnr)) for kdnr in csv_data.keys()
-    }
-
-    print(
-        f"found {len(csv_data)} complete (kdnr + kontoNR) entries in the CSV file. {len(database_data)} entries found in the database.\n"
-    )
-
-    missing_data = []
-    found_conflicts = 0
-    for kdr, (konto_nr_csv, konto_nr_db) in merged_data.items():
-        if konto_nr_csv == konto_nr_db:
-            continue
-        if konto_nr_db is None:
-            print(f"Kunde {kdr} is not in database but has a konto nr in the CSV.")
-            found_conflicts += 1
-            continue
-        if not konto_nr_db.strip("0"):
-            print(
-                f"Missing account number for customer number {kdr} in database. CSV Konto Nr: {konto_nr_csv}"
-            )
-            found_conflicts += 1
-            missing_data.append((kdr, konto_nr_csv))
-            continue
+    if not result.conflicts:
+        print("No conflicts found. Database is up to date.")
+        return 0
+    if not result.missing:
+        return 0
 
+    if args.apply:
+        apply_fixes(result.missing)
         print(
-            f"Kundennummer: {kdr}, Konto Nr differ: Konto Nr CSV: {konto_nr_csv}, Konto Nr DB: {konto_nr_db}"
+            f"\nSet {len(result.missing)} missing account numbers. Invoices already imported in a running converter need 'Reload account numbers'."
         )
-        found_conflicts += 1
-
-    if missing_data:
-        print("\nYou need to fix missing KtrNr in database with:")
+    else:
+        print("\nDry run, --apply would set the missing account numbers:")
+        for kd_nr, konto_nr in result.missing:
+            print(f"UPDATE Kunden SET DatevKtrNr = {konto_nr} WHERE KdNr = {kd_nr};")  # noqa: S608  # nosec
+    return 0
 
-        for kd_nr, konto_nr in missing_data:
-            print(f"UPDATE Kunden SET DatevKtrNr = {konto_nr} WHERE KdNr = {kd_nr};")  # noqa: S608 # nosec
 
-    if not found_conflicts:
-        print("No conflicts found. Database is up to date.")
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -18,6 +18,11 @@ from datev_creator.ledger_import import (
     Consolidate,
     LedgerImport,
 )
+from datev_creator.pdf_attachment import (
+    extract_invoice_xml,
+    find_invoice_xml,
+    may_contain_invoice_xml,
+)
 from datev_creator.utils import SOFTWARE_NAME, XmlAttribute, XmlBuilder
 from datev_creator.zugfert2ledger_import import zugfert_to_ledger_import
 
@@ -43,4 +48,7 @@ __all__ = (
     "LedgerImport",
     "SOFTWARE_NAME",
     "zugfert_to_ledger_import",
+    "find_invoice_xml",
+    "extract_invoice_xml",
+    "may_contain_invoice_xml",
 )
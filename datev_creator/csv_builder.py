@@ -5,10 +5,10 @@ from datetime import date, datetime
 from enum import IntEnum
 from io import StringIO
 from pathlib import Path
-from tkinter import messagebox
 from typing import Literal
 from uuid import UUID
 
+from datev_creator.datev_encoding import DatevTextFile, open_datev_csv
 from datev_creator.ledger_import import (
     AccountsReceivableLedger,
     LedgerImport,
@@ -729,6 +729,7 @@ def ledger_get_date(ledger: LedgerImport) -> date:
 class Buchungsstapel:
     header: Header
     items: list[BuchungsstapelItem]
+    skipped_no_account_no: int = 0
 
     @staticmethod
     def from_ledger_import_w_metadata(
@@ -782,11 +783,11 @@ class Buchungsstapel:
                     print(
                         f"Skipping ledger with invoice ID {ledger.consolidate.consolidated_invoice_id} due to missing account number."
                     )
-        if failed_no_account_count > 0:
-            messagebox.showwarning(
-                f"Skipped {failed_no_account_count} ledgers due to missing account numbers."
-            )
-        return Buchungsstapel(header=header, items=items)
+        return Buchungsstapel(
+            header=header,
+            items=items,
+            skipped_no_account_no=failed_no_account_count,
+        )
 
     def to_csv(self) -> str:
         """Convert the entire Buchungsstapel to a CSV string."""
@@ -798,12 +799,29 @@ class Buchungsstapel:
             lines.append(item.to_csv_line())
         return "\n".join(lines)
 
+    def write_csv(self, f: DatevTextFile) -> None:
+        """Write the same CSV as to_csv() line by line, the replaced characters are reported per invoice ID."""
+        f.write(self.header.to_csv_herder())
+        f.write("\n" + DATA_DESCRIPTION_HEAD)
+        for item in self.items:
+            f.record = item.Belegfeld_1
+            f.write("\n" + item.to_csv_line())
+        f.record = None
+
 
-def build_csv(data: Mapping[Path, LedgerImportWMetadataUUID], path: Path) -> None:
+def build_csv(data: Mapping[Path, LedgerImportWMetadataUUID], path: Path) -> int:
+    """Write the Buchungsstapel CSV of `data` to `path`.
+
+    Returns:
+        int: Number of ledgers skipped due to missing account numbers.
+
+    """
     buchungsstapel = Buchungsstapel.from_ledger_import_w_metadata(list(data.values()))
-    csv_content = buchungsstapel.to_csv()
-    with open(path, "w", encoding="ISO-8859-1") as f:
-        f.write(csv_content)
+    with open_datev_csv(path) as f:
+        buchungsstapel.write_csv(f)
+    if len(f.report) > 0:
+        print(f.report.summary())
+    return buchungsstapel.skipped_no_account_no
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""ISO-8859-1 (Western-1) output of the DATEV CSV files.
+
+DATEV expects ISO-8859-1, text from the invoices and the database may
+contain characters outside of it. They are replaced by the codec error
+handler "datev-transliterate" while the text is encoded (in one pass, the
+handler is only called for the characters that cannot be encoded) and each
+replacement is recorded in an EncodingReport.
+"""
+
+import codecs
+import os
+import unicodedata
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Iterator
+
+ENCODING = "iso-8859-1"
+ERROR_HANDLER = "datev-transliterate"
+
+TRANSLITERATIONS = {
+    "–": "-",  # en dash
+    "—": "-",  # em dash
+    "\u2010": "-",  # hyphen
+    "\u2011": "-",  # non-breaking hyphen
+    "\u2212": "-",  # minus sign
+    "€": "EUR",
+    # not '"', the text is already CSV quoted when it is encoded
+    "„": "'",
+    "“": "'",
+    "”": "'",
+    "‚": "'",
+    "‘": "'",
+    "’": "'",
+    "…": "...",
+    "•": "*",
+    "™": "(TM)",
+    "Ł": "L",  # no decomposition
+    "ł": "l",
+    "Œ": "OE",
+    "œ": "oe",
+    "\u2009": " ",  # thin space
+    "\u200b": "",  # zero width space
+}
+
+# characters of the report context on each side of a replaced character
+CONTEXT_CHARS = 20
+
+
+def transliterate(char: str) -> str:
+    """Return the ISO-8859-1 replacement of `char`, "?" if there is none."""
+    replacement = TRANSLITERATIONS.get(char)
+    if replacement is not None:
+        return replacement
+    # e.g. "č" -> "c", the base letter without the accents
+    base = "".join(
+        c
+        for c in unicodedata.normalize("NFKD", char)
+        if not unicodedata.combining(c)
+    )
+    try:
+        base.encode(ENCODING)
+    except UnicodeEncodeError:
+        return "?"
+    return base or "?"
+
+
+@dataclass
+class EncodingIssue:
+    """A character that was replaced, `record` identifies the CSV row (e.g. an invoice ID)."""
+
+    record: str | None
+    character: str
+    replacement: str
+    context: str
+
+    def __str__(self) -> str:
+        return f"{self.record or '-'}: '{self.character}' (U+{ord(self.character):04X}) -> '{self.replacement}' in '{self.context}'"
+
+
+@dataclass
+class EncodingReport:
+    issues: list[EncodingIssue] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.issues)
+
+    @property
+    def records(self) -> list[str | None]:
+        """The records with replaced characters, in file order."""
+        return list(dict.fromkeys(issue.record for issue in self.issues))
+
+    def summary(self, max_issues: int = 20) -> str:
+        if not self.issues:
+            return f"All characters could be encoded in {ENCODING}."
+        lines = [
+            f"{len(self.issues)} characters in {len(self.records)} records could not be encoded in {ENCODING} and were replaced:"
+        ]
+        lines.extend(f" - {issue}" for issue in self.issues[:max_issues])
+        if len(self.issues) > max_issues:
+            lines.append(f" ... and {len(self.issues) - max_issues} more")
+        return "\n".join(lines)
+
+
+# the report and the record of the text being encoded, set by DatevTextFile.write
+_current: ContextVar[tuple[EncodingReport, str | None] | None] = ContextVar(
+    "datev_encoding_current", default=None
+)
+
+
+def _transliterate_error(error: UnicodeError) -> tuple[str, int]:
+    if not isinstance(error, UnicodeEncodeError):
+        raise error
+    text = error.object
+    replacements = [transliterate(char) for char in text[error.start : error.end]]
+    current = _current.get()
+    if current is not None:
+        report, record = current
+        context = text[
+            max(0, error.start - CONTEXT_CHARS) : error.end + CONTEXT_CHARS
+        ].strip()
+        for char, replacement in zip(
+            text[error.start : error.end], replacements, strict=True
+        ):
+            report.issues.append(EncodingIssue(record, char, replacement, context))
+    return "".join(replacements), error.end
+
+
+codecs.register_error(ERROR_HANDLER, _transliterate_error)
+
+
+class DatevTextFile:
+    """Text file wrapper that writes ISO-8859-1 with transliteration, usable with csv.writer.
+
+    Set `record` before writing a row, the replacements of its characters are
+    reported with it.
+    """
+
+    def __init__(
+        self,
+        file: IO[bytes],
+        report: EncodingReport | None = None,
+        newline: str | None = None,
+    ):
+        """Wrap the binary `file`.
+
+        Args:
+            file (IO[bytes]): The file to write to.
+            report (EncodingReport | None, optional): Report to add the replacements to, a new one if None. Defaults to None.
+            newline (str | None, optional): Like the newline of open(): None translates line breaks to os.linesep, "" writes the text unchanged. Defaults to None.
+
+        """
+        self._file = file
+        self.report = report if report is not None else EncodingReport()
+        self._translate_newlines = newline is None and os.linesep != "\n"
+        self.record: str | None = None
+
+    def write(self, text: str) -> int:
+        data = text.replace("\n", os.linesep) if self._translate_newlines else text
+        token = _current.set((self.report, self.record))
+        try:
+            self._file.write(data.encode(ENCODING, ERROR_HANDLER))
+        finally:
+            _current.reset(token)
+        return len(text)
+
+
+@contextmanager
+def open_datev_csv(
+    path: str | Path, report: EncodingReport | None = None, newline: str | None = None
+) -> Iterator[DatevTextFile]:
+    """Open `path` for writing ISO-8859-1 text, see DatevTextFile."""
+    with open(path, "wb") as f:
+        yield DatevTextFile(f, report=report, newline=newline)
@@ -0,0 +1,112 @@
+from dataclasses import dataclass, field
+
+from drafthorse.models.document import Document
+from drafthorse.models.party import TradeParty
+from drafthorse.models.tradelines import LineItem
+
+
+@dataclass(slots=True)
+class InvoiceLineFacts:
+    """The fields of one invoice line item needed for the ledgers.
+
+    The tax rate is parsed once, when the line is read: `tax_rate_float` is
+    the rate as a number and `tax_rate` the rate as written to the ledger.
+    """
+
+    amount: str
+    tax_rate_percent: str
+    product_name: str
+    tax_rate_float: float = field(init=False)
+    tax_rate: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.tax_rate_float = float(self.tax_rate_percent)
+        self.tax_rate = f"{self.tax_rate_float:.2f}"
+
+
+@dataclass(slots=True)
+class InvoiceFacts:
+    """The fields of an invoice needed for the ledgers, independent of the XML parser.
+
+    The values are the strings the drafthorse model yields, e.g. "" for a
+    missing optional element, so all extractors create identical ledgers.
+    """
+
+    invoice_id: str
+    issue_date: str
+    currency_code: str
+    grand_total: str
+    seller_name: str
+    buyer_name: str
+    buyer_city: str | None
+    buyer_id: str | None
+    seller_tax_id: str | None
+    buyer_tax_id: str | None
+    ship_from_country: str | None
+    ship_to_country: str | None
+    due_date: str | None
+    delivery_date: str
+    order_id: str | None
+    lines: list[InvoiceLineFacts]
+
+
+def _line_amount(item: LineItem) -> str:
+    """The line total of `item`, else its gross or net price, "" if it has none."""
+    for amount in (
+        item.settlement.monetary_summation.total_amount,
+        item.agreement.gross.amount,
+        item.agreement.net.amount,
+    ):
+        # __str__ of these elements returns None or a Decimal, which str() rejects
+        value = amount.__str__()
+        if value is not None:
+            return str(value)
+    return ""
+
+
+def _line_facts_from_item(item: LineItem) -> InvoiceLineFacts:
+    settlement = item.settlement
+    return InvoiceLineFacts(
+        amount=_line_amount(item),
+        tax_rate_percent=str(settlement.trade_tax.rate_applicable_percent.__str__()),
+        product_name=str(item.product.name),
+    )
+
+
+def _tax_id(party: TradeParty) -> str | None:
+    """The ID of the first tax registration of `party`, None if it has none."""
+    tax_registrations = party.tax_registrations.children
+    if len(tax_registrations) == 0:
+        return None
+    return str(tax_registrations[0].id)
+
+
+def facts_from_document(document: Document) -> InvoiceFacts:
+    """Read the InvoiceFacts from a parsed drafthorse Document."""
+    trade = document.trade
+    seller = trade.agreement.seller
+    buyer = trade.agreement.buyer
+
+    seller_tax_id = _tax_id(seller)
+    if seller_tax_id is not None:
+        seller_tax_id = seller_tax_id.strip().removesuffix("(VA)").strip()
+
+    return InvoiceFacts(
+        invoice_id=str(document.header.id),
+        issue_date=str(document.header.issue_date_time),
+        currency_code=str(trade.settlement.currency_code),
+        grand_total=str(trade.settlement.monetary_summation.grand_total._amount),
+        seller_name=str(seller.name),
+        buyer_name=str(buyer.name),
+        buyer_city=str(buyer.address.city_name),
+        buyer_id=str(buyer.id),
+        seller_tax_id=seller_tax_id,
+        buyer_tax_id=_tax_id(buyer),
+        ship_from_country=str(seller.address.country_id),
+        ship_to_country=str(buyer.address.country_id),
+        # the payment terms and the buyer order reference are not mapped (yet)
+        due_date=None,
+        delivery_date=str(trade.delivery.event.occurrence),
+        order_id=None,
+        lines=[_line_facts_from_item(item) for item in trade.items.children],
+    )
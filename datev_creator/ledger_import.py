@@ -1,5 +1,6 @@
-from dataclasses import dataclass
-from typing import Literal, Sequence, TypeAlias, Union
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import IO, Any, Literal, Sequence, TypeAlias, Union
 from uuid import UUID
 
 from lxml import etree  # nosec B410
@@ -351,6 +352,20 @@ class CashLedger(XmlBuilder):
         return ledger
 
 
+def _write_element(xf: Any, element: etree._Element, level: int) -> None:
+    # element by element, xf.write(element) would declare the namespace again
+    # on every ledger, the xf.element() contexts know it from LedgerImport
+    indent = "\n" + "  " * level
+    xf.write(indent)
+    with xf.element(element.tag, attrib=dict(element.attrib)):
+        if element.text:
+            xf.write(element.text)
+        for child in element:
+            _write_element(xf, child, level + 1)
+        if len(element) > 0:
+            xf.write(indent)
+
+
 @dataclass
 class Consolidate(XmlBuilder):
     """Element LedgerImport/<consolidate>.
@@ -366,6 +381,9 @@ class Consolidate(XmlBuilder):
     | consolidatedOrderId | Attribut | Transaktions-ID für Zahlungsreferenz. Pflicht, wenn in base1 verwendet | 0...1 |
     | consolidatedCurrencyCode | Attribut | 3-stelliges Währungskürzel gem. ISO 4217 | 1...1 |
     | ledgers | Element (xsd:choice) | Daten für Eingangs-/Ausgangsrechnung/Kasse | 1...5000 |
+
+    An iterator of `ledgers` (e.g. from iter_ledgers_from_facts) is turned
+    into a list, the ledgers are read more than once (CSV, account lookup, XML).
     """
 
     consolidated_amount: str  # Summe der einzelnen Positionsbeträge
@@ -378,8 +396,12 @@ class Consolidate(XmlBuilder):
     consolidated_delivery_date: str | None = None  # Leistungsdatum
     consolidated_order_id: str | None = None  # Transaktions-ID für Zahlungsreferenz
 
+    def __post_init__(self) -> None:
+        if not isinstance(self.ledgers, Sequence):
+            self.ledgers = list(self.ledgers)
+
     @property
-    def xml(self) -> etree._Element:
+    def attributes(self) -> dict[str, str]:
         attributes: dict[str, str] = {
             "consolidatedAmount": self.consolidated_amount,
             "consolidatedDate": self.consolidated_date,
@@ -393,9 +415,13 @@ class Consolidate(XmlBuilder):
         if self.consolidated_order_id is not None:
             attributes["consolidatedOrderId"] = self.consolidated_order_id
 
+        return attributes
+
+    @property
+    def xml(self) -> etree._Element:
         consolidate: etree._Element = etree.Element(
             qn("consolidate"),
-            attrib=attributes,
+            attrib=self.attributes,
             nsmap=None,
         )
 
@@ -404,6 +430,19 @@ class Consolidate(XmlBuilder):
 
         return consolidate
 
+    def write(self, xf: Any) -> None:
+        """Write the element into an open etree.xmlfile, building one ledger tree at a time.
+
+        Args:
+            xf (Any): The writer of `with etree.xmlfile(...) as xf`, inside the LedgerImport element.
+
+        """
+        xf.write("\n  ")
+        with xf.element(qn("consolidate"), attrib=self.attributes):
+            for ledger in self.ledgers:
+                _write_element(xf, ledger.xml, level=2)
+            xf.write("\n  ")
+
 
 @dataclass
 class LedgerImport(XmlBuilder):
@@ -435,32 +474,106 @@ class LedgerImport(XmlBuilder):
     generating_system: str | None = None  # Software, welche die XML-Datei erzeugt hat
 
     @property
-    def xml(self) -> etree._ElementTree:
+    def attributes(self) -> dict[str, str]:
         attributes: dict[str, str] = {
             "{http://www.w3.org/2001/XMLSchema-instance}schemaLocation": self.xsi_schema_location,
             "version": self.version,
             "generator_info": self.generator_info,
             "xml_data": self.xml_data,
         }
-        print(attributes)
         if self.generating_system is not None:
             attributes["generating_system"] = self.generating_system
+        return attributes
+
+    @property
+    def nsmap(self) -> dict[str | None, str]:
+        return {
+            None: self.xmlns,
+            "xsi": self.xmlns_xsi,
+        }
 
+    @property
+    def xml(self) -> etree._ElementTree:
         xml: etree._Element = etree.Element(
             qn("LedgerImport"),
-            attrib=attributes,
-            nsmap={
-                None: self.xmlns,
-                "xsi": self.xmlns_xsi,
-            },
+            attrib=self.attributes,
+            nsmap=self.nsmap,
         )
 
         xml.append(self.consolidate.xml)
 
         return etree.ElementTree(xml)
 
+    def write(self, file: str | Path | IO[bytes]) -> None:
+        """Serialize to `file` (utf-8) without building the whole tree.
+
+        Unlike `xml`, only the element tree of one ledger is in memory at a
+        time and the output is not buffered, so an invoice with thousands of
+        ledgers needs no more memory for its XML than one with a single ledger.
+        The output is the same XML as `xml`, apart from empty elements written
+        as start and end tag.
+
+        Args:
+            file (str | Path | IO[bytes]): The file (path) to write to.
+
+        """
+        with etree.xmlfile(file, encoding="utf-8") as xf:
+            xf.write_declaration()
+            with xf.element(
+                qn("LedgerImport"), attrib=self.attributes, nsmap=self.nsmap
+            ):
+                self.consolidate.write(xf)
+                xf.write("\n")
+
 
 LedgerImportWMetadata = tuple[LedgerImport, tuple[int, int]]
 """LedgerImport [year, month]"""
 
 LedgerImportWMetadataUUID = tuple[LedgerImport, tuple[int, int], UUID]
+
+
+_LEDGER_TYPES: dict[
+    str,
+    type[AccountsPayableLedger] | type[AccountsReceivableLedger] | type[CashLedger],
+] = {
+    "accountsPayableLedger": AccountsPayableLedger,
+    "accountsReceivableLedger": AccountsReceivableLedger,
+    "cashLedger": CashLedger,
+}
+_LEDGER_TYPE_NAMES = {cls: name for name, cls in _LEDGER_TYPES.items()}
+
+
+def ledger_import_to_dict(ledger_import: LedgerImport) -> dict[str, Any]:
+    """Convert a LedgerImport into JSON serializable dicts (see ledger_import_from_dict)."""
+    data = asdict(ledger_import)
+    data["consolidate"]["ledgers"] = [
+        {
+            "type": _LEDGER_TYPE_NAMES[type(ledger)],
+            **asdict(ledger),
+        }
+        for ledger in ledger_import.consolidate.ledgers
+    ]
+    return data
+
+
+def ledger_import_from_dict(data: dict[str, Any]) -> LedgerImport:
+    """Rebuild a LedgerImport from the output of ledger_import_to_dict."""
+    consolidate = dict(data["consolidate"])
+    ledgers: list[AccountsPayableLedger | AccountsReceivableLedger | CashLedger] = []
+    for ledger_data in consolidate.pop("ledgers"):
+        ledger_data = dict(ledger_data)
+        ledger_cls = _LEDGER_TYPES[ledger_data.pop("type")]
+        if "base1" in ledger_data:
+            base1 = dict(ledger_data["base1"])
+            base1["base"] = Base(**base1["base"])
+            ledger_data["base1"] = Base1(**base1)
+        if "base" in ledger_data:
+            ledger_data["base"] = Base(**ledger_data["base"])
+        ledgers.append(ledger_cls(**ledger_data))
+
+    return LedgerImport(
+        **{
+            **data,
+            "consolidate": Consolidate(**consolidate, ledgers=ledgers),
+        }
+    )
@@ -0,0 +1,193 @@
+import mmap
+from itertools import chain
+from pathlib import Path
+from typing import IO, Iterator
+
+from pypdf import PdfReader
+from pypdf.generic import DictionaryObject
+
+INVOICE_ATTACHMENT_NAMES = (
+    "factur-x.xml",  # Factur-X / ZUGFeRD 2.1+
+    "zugferd-invoice.xml",  # ZUGFeRD 2.0
+    "ZUGFeRD-invoice.xml",  # ZUGFeRD 1.0
+    "xrechnung.xml",  # XRechnung embedded as ZUGFeRD profile
+)
+"""File names of invoice XMLs embedded in a hybrid PDF, most preferred first."""
+
+_NAME_PRIORITY = {name: i for i, name in enumerate(INVOICE_ATTACHMENT_NAMES)}
+
+# guards against reference cycles in broken name trees
+_MAX_NAME_TREE_DEPTH = 32
+
+# startxref and the trailer are at the very end of the file
+_TAIL_SIZE = 2048
+# any of these means the PDF may have an embedded invoice XML:
+# attachment entries, embedded file streams and Factur-X/ZUGFeRD XMP metadata
+_ATTACHMENT_MARKERS = (
+    b"/EmbeddedFile",  # also matches /EmbeddedFiles
+    b"/AF",
+    b"/EF",
+    b"fx:",
+    b"urn:factur-x",
+    b"urn:zugferd",
+    b"zf:",
+)
+
+
+def _in_limits(limits: object) -> bool:
+    """Check whether a name tree node with /Limits [first last] can contain one of the invoice names."""
+    if not isinstance(limits, list) or len(limits) != 2:
+        return True
+    first, last = (limit.get_object() for limit in limits)
+    if not isinstance(first, str) or not isinstance(last, str):
+        return True
+    return any(first <= name <= last for name in INVOICE_ATTACHMENT_NAMES)
+
+
+def _name_tree_candidates(
+    node: DictionaryObject, depth: int = 0
+) -> Iterator[tuple[str, DictionaryObject]]:
+    """Yield (name, file specification) of the invoice names in an EmbeddedFiles name tree.
+
+    Only follows /Kids whose /Limits can contain one of the names, the other
+    subtrees are never resolved.
+    """
+    if depth > _MAX_NAME_TREE_DEPTH:
+        return
+
+    names = node.get("/Names")
+    if names is not None:
+        names = names.get_object()
+        for i in range(0, len(names) - 1, 2):
+            name = names[i].get_object()
+            if isinstance(name, str) and name in _NAME_PRIORITY:
+                yield str(name), names[i + 1].get_object()
+
+    kids = node.get("/Kids")
+    if kids is not None:
+        for kid in kids.get_object():
+            kid = kid.get_object()
+            limits = kid.get("/Limits")
+            if _in_limits(limits.get_object() if limits is not None else None):
+                yield from _name_tree_candidates(kid, depth + 1)
+
+
+def _associated_file_candidates(
+    catalog: DictionaryObject,
+) -> Iterator[tuple[str, DictionaryObject]]:
+    """Yield (name, file specification) of the invoice names in the PDF/A-3 /AF array."""
+    associated_files = catalog.get("/AF")
+    if associated_files is None:
+        return
+    for file_spec in associated_files.get_object():
+        file_spec = file_spec.get_object()
+        if not isinstance(file_spec, DictionaryObject):
+            continue
+        name = file_spec.get("/UF") or file_spec.get("/F")
+        if name is None:
+            # malformed entry without file name, cannot be the invoice
+            continue
+        name = name.get_object()
+        if isinstance(name, str) and name in _NAME_PRIORITY:
+            yield str(name), file_spec
+
+
+def _file_spec_data(file_spec: DictionaryObject) -> bytes | None:
+    embedded = file_spec.get("/EF")
+    if embedded is None:
+        return None
+    embedded = embedded.get_object()
+    stream = embedded.get("/F") or embedded.get("/UF")
+    if stream is None:
+        return None
+    return stream.get_object().get_data()
+
+
+def may_contain_invoice_xml(pdf: Path) -> bool:
+    """Cheap check whether a PDF can have an embedded invoice XML, without parsing it.
+
+    The file is memory-mapped and searched for attachment and Factur-X XMP
+    markers. Only returns False if the PDF clearly has none: a PDF with a
+    missing or broken cross-reference section or with compressed object
+    streams (/ObjStm, where the catalog entries are not visible in the raw
+    bytes) is always reported as a candidate.
+
+    Args:
+        pdf (Path): The PDF file.
+
+    Returns:
+        bool: False if the PDF certainly has no embedded invoice XML.
+
+    """
+    with open(pdf, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file, let the parser report it
+            return True
+
+    with data:
+        tail_start = max(len(data) - _TAIL_SIZE, 0)
+        startxref = data.rfind(b"startxref", tail_start)
+        if startxref == -1:
+            return True
+        try:
+            xref_offset = int(data[startxref + 9 : startxref + 40].split()[0])
+        except (IndexError, ValueError):
+            return True
+        if xref_offset >= len(data):
+            return True
+
+        # a cross-reference stream instead of a classic xref table means the
+        # objects may be compressed
+        if data[xref_offset : xref_offset + 4] != b"xref":
+            return True
+        if data.find(b"/ObjStm") != -1:
+            return True
+
+        return any(data.find(marker) != -1 for marker in _ATTACHMENT_MARKERS)
+
+
+def find_invoice_xml(pdf: Path | IO[bytes]) -> tuple[str, bytes] | None:
+    """Locate the embedded ZUGFeRD/Factur-X/XRechnung XML of a PDF.
+
+    Searches the /EmbeddedFiles name tree (including nested /Kids) and the
+    PDF/A-3 /AF array of the catalog in a single pass. Only the objects on the
+    way to the attachment are resolved, pages and images are never loaded.
+
+    Args:
+        pdf (Path | IO[bytes]): The PDF file or a binary stream of it.
+
+    Returns:
+        tuple[str, bytes] | None: (attachment name, XML content) of the most preferred name in INVOICE_ATTACHMENT_NAMES or None if there is none.
+
+    """
+    reader = PdfReader(pdf, strict=False)
+    catalog = reader.trailer["/Root"].get_object()
+
+    candidates: list[Iterator[tuple[str, DictionaryObject]]] = []
+    names = catalog.get("/Names")
+    if names is not None:
+        embedded_files = names.get_object().get("/EmbeddedFiles")
+        if embedded_files is not None:
+            candidates.append(_name_tree_candidates(embedded_files.get_object()))
+    candidates.append(_associated_file_candidates(catalog))
+
+    best: tuple[str, DictionaryObject] | None = None
+    for name, file_spec in chain(*candidates):
+        if best is None or _NAME_PRIORITY[name] < _NAME_PRIORITY[best[0]]:
+            best = (name, file_spec)
+        if _NAME_PRIORITY[name] == 0:
+            break
+
+    if best is None:
+        return None
+    data = _file_spec_data(best[1])
+    if data is None:
+        return None
+    return best[0], data
+
+
+def extract_invoice_xml(pdf: Path | IO[bytes]) -> bytes | None:
+    """Return the content of the embedded invoice XML of a PDF or None."""
+    found = find_invoice_xml(pdf)
+    return found[1] if found is not None else None
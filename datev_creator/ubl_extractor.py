@@ -0,0 +1,179 @@
+from datetime import date
+from decimal import Decimal
+
+from lxml import etree
+
+from datev_creator.invoice_facts import InvoiceFacts, InvoiceLineFacts
+
+NS_INVOICE = "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+NS_CREDIT_NOTE = "urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2"
+NS_CAC = "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+NS_CBC = "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
+UBL_ROOT_TAGS = (f"{{{NS_INVOICE}}}Invoice", f"{{{NS_CREDIT_NOTE}}}CreditNote")
+
+_NAMESPACES = {"cac": NS_CAC, "cbc": NS_CBC}
+
+_INVOICE_ID_TAG = f"{{{NS_CBC}}}ID"
+_ISSUE_DATE_TAG = f"{{{NS_CBC}}}IssueDate"
+_CURRENCY_CODE_TAG = f"{{{NS_CBC}}}DocumentCurrencyCode"
+_SELLER_TAG = f"{{{NS_CAC}}}AccountingSupplierParty"
+_BUYER_TAG = f"{{{NS_CAC}}}AccountingCustomerParty"
+_DELIVERY_TAG = f"{{{NS_CAC}}}Delivery"
+_MONETARY_TOTAL_TAG = f"{{{NS_CAC}}}LegalMonetaryTotal"
+_LINE_ITEM_TAGS = (f"{{{NS_CAC}}}InvoiceLine", f"{{{NS_CAC}}}CreditNoteLine")
+
+
+def _xpath(path: str) -> etree.XPath:
+    return etree.XPath(path, namespaces=_NAMESPACES)
+
+
+# relative to cac:LegalMonetaryTotal
+_GRAND_TOTAL = _xpath("cbc:TaxInclusiveAmount")
+# relative to cac:AccountingSupplierParty and cac:AccountingCustomerParty
+_PARTY_NAME = _xpath("cac:Party/cac:PartyLegalEntity/cbc:RegistrationName")
+_PARTY_TRADING_NAME = _xpath("cac:Party/cac:PartyName/cbc:Name")
+_PARTY_ID = _xpath("cac:Party/cac:PartyIdentification/cbc:ID")
+_PARTY_CITY = _xpath("cac:Party/cac:PostalAddress/cbc:CityName")
+_PARTY_COUNTRY = _xpath(
+    "cac:Party/cac:PostalAddress/cac:Country/cbc:IdentificationCode"
+)
+_PARTY_TAX_SCHEME = _xpath("cac:Party/cac:PartyTaxScheme[1]")
+# relative to cac:PartyTaxScheme
+_TAX_SCHEME_COMPANY_ID = _xpath("cbc:CompanyID")
+_TAX_SCHEME_ID = _xpath("cac:TaxScheme/cbc:ID")
+# relative to cac:Delivery
+_DELIVERY_DATE = _xpath("cbc:ActualDeliveryDate")
+# relative to cac:InvoiceLine and cac:CreditNoteLine
+_LINE_AMOUNT = _xpath("cbc:LineExtensionAmount")
+# the gross and the net price are the fallbacks of a line without amount
+_LINE_GROSS_PRICE = _xpath("cac:Price/cac:AllowanceCharge/cbc:BaseAmount")
+_LINE_NET_PRICE = _xpath("cac:Price/cbc:PriceAmount")
+_LINE_TAX_RATE = _xpath("cac:Item/cac:ClassifiedTaxCategory/cbc:Percent")
+_LINE_PRODUCT_NAME = _xpath("cac:Item/cbc:Name")
+
+# The helpers below produce the same strings as the CII extractor, so UBL and
+# CII invoices with the same content have the same InvoiceFacts.
+
+
+def _first(nodes: list[etree._Element]) -> etree._Element | None:
+    return nodes[0] if nodes else None
+
+
+def _text(nodes: list[etree._Element]) -> str:
+    node = _first(nodes)
+    return "" if node is None else str(node.text)
+
+
+def _decimal(nodes: list[etree._Element], missing: str) -> str:
+    node = _first(nodes)
+    if node is None:
+        return missing
+    return str(Decimal(node.text))  # type: ignore[arg-type]
+
+
+def _date(nodes: list[etree._Element]) -> str:
+    node = _first(nodes)
+    if node is None:
+        return "None"
+    return str(date.fromisoformat((node.text or "").strip()))
+
+
+def _select(
+    path: etree.XPath, contexts: list[etree._Element]
+) -> list[etree._Element]:
+    return [node for context in contexts for node in path(context)]
+
+
+def _tax_id(tax_schemes: list[etree._Element]) -> str | None:
+    # CII registrations are "<id> (VA)" for VAT IDs and "<id> (FC)" for tax numbers
+    tax_scheme = _first(tax_schemes)
+    if tax_scheme is None:
+        return None
+    scheme = "VA" if _text(_TAX_SCHEME_ID(tax_scheme)) == "VAT" else "FC"
+    company_id = _first(_TAX_SCHEME_COMPANY_ID(tax_scheme))
+    if company_id is None:
+        return " ()"
+    return f"{company_id.text} ({scheme})"
+
+
+def ubl_facts(root: etree._Element) -> InvoiceFacts:
+    """Read the InvoiceFacts from a UBL (XRechnung UBL) Invoice or CreditNote.
+
+    Args:
+        root (etree._Element): The ubl:Invoice or ubl:CreditNote root element.
+
+    Raises:
+        TypeError: if `root` is not a UBL invoice or credit note.
+        ValueError: if the tax rate of a line item is missing.
+
+    Returns:
+        InvoiceFacts: The facts, the same as those of the CII version of the invoice.
+
+    """
+    if root.tag not in UBL_ROOT_TAGS:
+        raise TypeError(
+            f"Invalid XML, found tag {root.tag} where one of {UBL_ROOT_TAGS} was expected"
+        )
+
+    # the children of the root are walked once, the line items are read on the
+    # way and the XPath expressions below only search the header elements
+    fields: dict[str, list[etree._Element]] = {
+        _INVOICE_ID_TAG: [],
+        _ISSUE_DATE_TAG: [],
+        _CURRENCY_CODE_TAG: [],
+        _SELLER_TAG: [],
+        _BUYER_TAG: [],
+        _DELIVERY_TAG: [],
+        _MONETARY_TOTAL_TAG: [],
+    }
+    lines: list[InvoiceLineFacts] = []
+    for child in root:
+        tag = child.tag
+        if tag in _LINE_ITEM_TAGS:
+            lines.append(
+                InvoiceLineFacts(
+                    amount=_decimal(
+                        _LINE_AMOUNT(child)
+                        or _LINE_GROSS_PRICE(child)
+                        or _LINE_NET_PRICE(child),
+                        missing="",
+                    ),
+                    tax_rate_percent=_decimal(_LINE_TAX_RATE(child), missing="None"),
+                    product_name=_text(_LINE_PRODUCT_NAME(child)),
+                )
+            )
+        elif tag in fields:
+            fields[tag].append(child)
+    sellers = fields[_SELLER_TAG]
+    buyers = fields[_BUYER_TAG]
+
+    seller_tax_id = _tax_id(_select(_PARTY_TAX_SCHEME, sellers))
+    if seller_tax_id is not None:
+        seller_tax_id = seller_tax_id.strip().removesuffix("(VA)").strip()
+
+    return InvoiceFacts(
+        invoice_id=_text(fields[_INVOICE_ID_TAG]),
+        issue_date=_date(fields[_ISSUE_DATE_TAG]),
+        currency_code=_text(fields[_CURRENCY_CODE_TAG]),
+        grand_total=_decimal(
+            _select(_GRAND_TOTAL, fields[_MONETARY_TOTAL_TAG]), missing=""
+        ),
+        # the legal name, like the CII seller/buyer name
+        seller_name=_text(
+            _select(_PARTY_NAME, sellers) or _select(_PARTY_TRADING_NAME, sellers)
+        ),
+        buyer_name=_text(
+            _select(_PARTY_NAME, buyers) or _select(_PARTY_TRADING_NAME, buyers)
+        ),
+        buyer_city=_text(_select(_PARTY_CITY, buyers)),
+        buyer_id=_text(_select(_PARTY_ID, buyers)),
+        seller_tax_id=seller_tax_id,
+        buyer_tax_id=_tax_id(_select(_PARTY_TAX_SCHEME, buyers)),
+        ship_from_country=_text(_select(_PARTY_COUNTRY, sellers)),
+        ship_to_country=_text(_select(_PARTY_COUNTRY, buyers)),
+        # not mapped for CII either
+        due_date=None,
+        delivery_date=_date(_select(_DELIVERY_DATE, fields[_DELIVERY_TAG])),
+        order_id=None,
+        lines=lines,
+    )
@@ -1,48 +1,234 @@
-# xsd zips
+"""Validation of the DATEV XML files against the XSD files of the xsd_store.
 
-from io import BytesIO
+The schemas are loaded on first use, importing this module reads no files.
+"""
+
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from zipfile import ZipFile
+from threading import Lock
+from typing import Iterable, Sequence
 
-import requests
 from lxml import etree  # nosec B410
 
-xsd_zip = "https://developer.datev.de/assets/XSD_3c866dbe96.zip"
-# check if xsd folder exists
-xsd_folder = Path(__file__).parent / "xsd"
-if not xsd_folder.exists():
-    xsd_folder.mkdir(parents=True, exist_ok=True)
-    # download and unzip
-    try:
-        response = requests.get(xsd_zip, timeout=10)
-        with ZipFile(BytesIO(response.content)) as thezip:
-            thezip.extractall(xsd_folder)
-    except Exception as e:
-        xsd_folder.rmdir()
-        raise e
-    print(f"Downloaded and extracted XSD files to {xsd_folder}")
+from datev_creator.xsd_store import xsd_store
 
+XSI_SCHEMA_LOCATION = "{http://www.w3.org/2001/XMLSchema-instance}schemaLocation"
 
-def validate_xml(xml_elem: etree._Element) -> bool:
-    # xml_elem already contains information like "xsi:schemaLocation="http://xml.datev.de/bedi/tps/ledger/v060 Belegverwaltung_online_ledger_import_v060.xsd"" now load the xsd from the xsd folder
-    schema_location = xml_elem.attrib.get(
-        "{http://www.w3.org/2001/XMLSchema-instance}schemaLocation"
-    )
-    if not schema_location:
-        raise ValueError("No schemaLocation found in XML")
+# the schemas of document.xml and the ledger XMLs, see archive.py and ledger_import.py
+DEFAULT_SCHEMA_LOCATIONS = (
+    "http://xml.datev.de/bedi/tps/document/v06.0 Document_v060.xsd",
+    "http://xml.datev.de/bedi/tps/ledger/v060 Belegverwaltung_online_ledger_import_v060.xsd",
+)
+
+
+@dataclass
+class SchemaTimings:
+    """Time spent compiling schemas and validating documents in this process."""
+
+    compiled: int = 0
+    compile_seconds: float = 0.0
+    validated: int = 0
+    validate_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        per_document = (
+            self.validate_seconds / self.validated * 1000 if self.validated > 0 else 0.0
+        )
+        return (
+            f"{self.compiled} schemas compiled in {self.compile_seconds:.2f}s, "
+            f"{self.validated} documents validated in {self.validate_seconds:.2f}s "
+            f"({per_document:.2f}ms per document)"
+        )
+
+
+# compiled schemas per schemaLocation, shared by all validations of the process
+_schemas: dict[str, etree.XMLSchema] = {}
+_schemas_lock = Lock()
+
+schema_timings = SchemaTimings()
+"""The compile and validate timings of this process, see SchemaTimings."""
+
+
+def schema_file(schema_location: str) -> Path:
+    """The XSD file in the xsd_store of an xsi:schemaLocation ("<namespace> <file name>").
+
+    Raises:
+        ValueError: if `schema_location` is not a namespace and a file name or the XSD files do not match their checksums.
+        FileNotFoundError: if the XSD file is not installed.
+
+    """
     # schema_location is a string with two parts, the second part is the xsd file name
     parts = schema_location.split()
     if len(parts) != 2:
         raise ValueError("Invalid schemaLocation format")
-    xsd_file_name = parts[1]
-    xsd_file_path = xsd_folder / xsd_file_name
-    if not xsd_file_path.exists():
-        raise FileNotFoundError(f"XSD file {xsd_file_path} not found")
-    with open(xsd_file_path, "rb") as f:
-        xsd_doc = etree.parse(f)  # noqa: S320 # nosec B320
+    return xsd_store.path(parts[1])
+
+
+def get_schema(schema_location: str) -> etree.XMLSchema:
+    """Return the compiled schema of `schema_location`, it is compiled on first use and then cached.
+
+    Raises:
+        ValueError: if `schema_location` is not a namespace and a file name or the XSD files do not match their checksums.
+        FileNotFoundError: if the XSD file is not installed.
+
+    """
+    with _schemas_lock:
+        xmlschema = _schemas.get(schema_location)
+        if xmlschema is not None:
+            return xmlschema
+        start = time.perf_counter()
+        with open(schema_file(schema_location), "rb") as f:
+            xsd_doc = etree.parse(f)  # noqa: S320 # nosec B320
         xmlschema = etree.XMLSchema(xsd_doc)
-        is_valid = xmlschema.validate(xml_elem)
-        if not is_valid:
-            log = xmlschema.error_log
-            raise ValueError(f"XML validation error: {log.last_error}")
-        return True
+        schema_timings.compiled += 1
+        schema_timings.compile_seconds += time.perf_counter() - start
+        _schemas[schema_location] = xmlschema
+        return xmlschema
+
+
+def warm_schema_cache(
+    schema_locations: Iterable[str] = DEFAULT_SCHEMA_LOCATIONS,
+) -> None:
+    """Compile the schemas before the first validation, e.g. as initializer of a process pool worker."""
+    for schema_location in schema_locations:
+        get_schema(schema_location)
+
+
+def clear_schema_cache() -> None:
+    """Forget the compiled schemas, e.g. after another XSD version was installed."""
+    with _schemas_lock:
+        _schemas.clear()
+
+
+def validate_xml(xml_elem: etree._Element) -> bool:
+    """Validate `xml_elem` against the XSD of its xsi:schemaLocation, compiled once per process.
+
+    Raises:
+        ValueError: if the schemaLocation is missing or invalid, the XSD files do not match their checksums or the XML is not valid.
+        FileNotFoundError: if the XSD file is not installed.
+
+    """
+    # xml_elem already contains information like "xsi:schemaLocation="http://xml.datev.de/bedi/tps/ledger/v060 Belegverwaltung_online_ledger_import_v060.xsd""
+    schema_location = xml_elem.attrib.get(XSI_SCHEMA_LOCATION)
+    if not schema_location:
+        raise ValueError("No schemaLocation found in XML")
+    xmlschema = get_schema(schema_location)
+    start = time.perf_counter()
+    is_valid = xmlschema.validate(xml_elem)
+    schema_timings.validated += 1
+    schema_timings.validate_seconds += time.perf_counter() - start
+    if not is_valid:
+        log = xmlschema.error_log
+        raise ValueError(f"XML validation error: {log.last_error}")
+    return True
+
+
+# files per task of the validation pool, fewer round trips than one per file
+VALIDATION_BATCH_SIZE = 50
+# below this number of files the pool costs more than it saves
+PARALLEL_VALIDATION_MIN_FILES = 200
+
+
+@dataclass
+class ValidationResult:
+    """Result of validating one serialized XML file, `error` is None if it is valid."""
+
+    name: str
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+def _validate_batch(
+    files: Sequence[tuple[str, bytes | Path]],
+) -> list[ValidationResult]:
+    # runs in the worker processes, so every failure is turned into a result
+    results = []
+    for name, data in files:
+        result = ValidationResult(name)
+        start = time.perf_counter()
+        try:
+            if isinstance(data, Path):
+                xml_elem = etree.parse(str(data)).getroot()  # noqa: S320 # nosec B320
+            else:
+                xml_elem = etree.fromstring(data)  # noqa: S320 # nosec B320
+            validate_xml(xml_elem)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.seconds = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def _init_worker(schema_locations: Iterable[str]) -> None:
+    try:
+        warm_schema_cache(schema_locations)
+    except Exception:  # nosec B110
+        # not fatal for the pool, validate_xml reports it for every file
+        pass
+
+
+def _future_results(
+    batch: Sequence[tuple[str, bytes | Path]], future: Future[list[ValidationResult]]
+) -> list[ValidationResult]:
+    try:
+        return future.result()
+    except Exception as e:  # e.g. BrokenProcessPool when a worker dies
+        return [ValidationResult(name, f"{type(e).__name__}: {e}") for name, _ in batch]
+
+
+def validate_xml_files(
+    files: Iterable[tuple[str, bytes | Path]],
+    max_workers: int | None = None,
+    schema_locations: Iterable[str] = DEFAULT_SCHEMA_LOCATIONS,
+    batch_size: int = VALIDATION_BATCH_SIZE,
+) -> list[ValidationResult]:
+    """Validate serialized XML files in a process pool, see validate_xml.
+
+    Every worker compiles the schemas once when it starts and keeps them for
+    all its files. Small sets of files (below PARALLEL_VALIDATION_MIN_FILES)
+    are validated in the calling process.
+
+    Args:
+        files (Iterable[tuple[str, bytes | Path]]): The (file name, XML bytes or XML file) to validate, files are read by the workers.
+        max_workers (int | None, optional): Size of the process pool, 1 validates in the calling process. Defaults to None (number of CPUs).
+        schema_locations (Iterable[str], optional): The schemas the workers compile on start. Defaults to DEFAULT_SCHEMA_LOCATIONS.
+        batch_size (int, optional): Files per task. Defaults to VALIDATION_BATCH_SIZE.
+
+    Returns:
+        list[ValidationResult]: One result per file, in input order.
+
+    """
+    file_list = list(files)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if len(file_list) < PARALLEL_VALIDATION_MIN_FILES:
+        max_workers = 1
+    # at least one batch per worker
+    batch_size = max(1, min(batch_size, -(-len(file_list) // max(max_workers, 1))))
+    batches = [
+        file_list[i : i + batch_size] for i in range(0, len(file_list), batch_size)
+    ]
+    max_workers = min(max_workers, len(batches))
+
+    if max_workers <= 1:
+        return _validate_batch(file_list)
+
+    results: list[ValidationResult] = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(tuple(schema_locations),),
+    ) as executor:
+        futures = [
+            (batch, executor.submit(_validate_batch, batch)) for batch in batches
+        ]
+        for batch, future in futures:
+            results.extend(_future_results(batch, future))
+    return results
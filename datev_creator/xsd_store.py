@@ -0,0 +1,368 @@
+"""Local, versioned store of the DATEV XSD files, without network access.
+
+The XSD zip is downloaded by hand (e.g. from DATEV_XSD_ZIP_URL) and installed
+with `python -m datev_creator.xsd_store install XSD.zip`. Every install is
+extracted to its own folder xsd/<version>/ with a manifest of the SHA-256 of
+the zip and of every file, xsd/CURRENT names the version in use. The files
+are checked against the manifest the first time a schema is needed.
+
+Before the store, the zip was extracted directly into xsd/. Such a flat
+folder is adopted as the version "legacy" when no version is installed, or
+with `python -m datev_creator.xsd_store adopt`.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Sequence
+from zipfile import ZipFile
+
+XSD_FOLDER = Path(__file__).parent / "xsd"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+LEGACY_VERSION = "legacy"
+
+# where the zip was downloaded from before, only for the instructions
+DATEV_XSD_ZIP_URL = "https://developer.datev.de/assets/XSD_3c866dbe96.zip"
+
+KNOWN_ZIP_SHA256: dict[str, str] = {}
+"""The SHA-256 of the known XSD zips by file name, the default expected SHA-256 of an install.
+
+Add the SHA-256 of a zip once it has been verified, e.g.
+"XSD_3c866dbe96.zip": "<sha256>". Installing a zip which is not listed
+prints its SHA-256.
+"""
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 16):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_checksums(folder: Path) -> dict[str, str]:
+    return {
+        path.relative_to(folder).as_posix(): _sha256(path)
+        for path in sorted(folder.rglob("*"))
+        if path.is_file()
+    }
+
+
+def _check_version(version: str) -> None:
+    if not version or version != Path(version).name or version.startswith("."):
+        raise ValueError(f"Invalid version name: {version!r}")
+
+
+@dataclass
+class XsdManifest:
+    """An installed version, `files` maps the paths (relative, with "/") to their SHA-256."""
+
+    version: str
+    source: str
+    zip_sha256: str
+    installed_at: str
+    files: dict[str, str] = field(default_factory=dict)
+
+
+class XsdStore:
+    def __init__(self, root: Path = XSD_FOLDER):
+        self.root = root
+        self._manifest: XsdManifest | None = None
+        self._lock = Lock()
+
+    def current_version(self) -> str | None:
+        current_file = self.root / CURRENT_FILE
+        if not current_file.is_file():
+            return None
+        return current_file.read_text(encoding="utf-8").strip() or None
+
+    def version_folder(self, version: str) -> Path:
+        return self.root / version
+
+    def _read_manifest(self, version: str) -> XsdManifest:
+        with open(
+            self.version_folder(version) / MANIFEST_FILE, encoding="utf-8"
+        ) as f:
+            return XsdManifest(**json.load(f))
+
+    def verify(self, version: str | None = None) -> list[str]:
+        """Check the files of `version` (default: the current one) against its manifest.
+
+        Returns:
+            list[str]: The problems found, empty if the files are unchanged.
+
+        """
+        version = version or self.current_version()
+        if version is None:
+            return ["No XSD version installed"]
+        try:
+            manifest = self._read_manifest(version)
+        except (OSError, ValueError, TypeError) as e:
+            return [f"Unreadable manifest of {version}: {e}"]
+        folder = self.version_folder(version)
+        problems = []
+        for name, sha256 in manifest.files.items():
+            path = folder / name
+            if not path.is_file():
+                problems.append(f"{name} is missing")
+            elif _sha256(path) != sha256:
+                problems.append(f"{name} does not match its checksum")
+        return problems
+
+    def legacy_files(self) -> list[Path]:
+        """The entries of a flat xsd/ folder from before the store, empty if there are no XSD files."""
+        if not self.root.is_dir() or not any(self.root.glob("*.xsd")):
+            return []
+        return [
+            path
+            for path in sorted(self.root.iterdir())
+            if not path.name.startswith(".")
+            and not path.name.startswith(CURRENT_FILE)
+            and not (path / MANIFEST_FILE).is_file()
+        ]
+
+    def manifest(self) -> XsdManifest:
+        """The manifest of the current version, its files are verified once on first use.
+
+        A flat xsd/ folder from before the store is adopted first if no
+        version is installed.
+
+        Raises:
+            FileNotFoundError: if no version is installed.
+            ValueError: if the files do not match the manifest.
+
+        """
+        with self._lock:
+            if self._manifest is not None:
+                return self._manifest
+            version = self.current_version()
+            if version is None and self.legacy_files():
+                version = self._adopt(LEGACY_VERSION).version
+                print(f"Adopted the XSD files in {self.root} as version {version}")
+            if version is None:
+                raise FileNotFoundError(
+                    f"No XSD files installed in {self.root}. Download {DATEV_XSD_ZIP_URL} and run: python -m datev_creator.xsd_store install <zip>"
+                )
+            problems = self.verify(version)
+            if problems:
+                raise ValueError(
+                    f"XSD files {version} in {self.root} are damaged, install them again: {'; '.join(problems)}"
+                )
+            self._manifest = self._read_manifest(version)
+            return self._manifest
+
+    def path(self, file_name: str) -> Path:
+        """The verified path of the XSD `file_name` of the current version.
+
+        Raises:
+            FileNotFoundError: if no version is installed or it has no `file_name`.
+            ValueError: if the files do not match the manifest.
+
+        """
+        manifest = self.manifest()
+        if file_name not in manifest.files:
+            raise FileNotFoundError(
+                f"XSD file {file_name} not found in version {manifest.version}"
+            )
+        return self.version_folder(manifest.version) / file_name
+
+    def install(
+        self,
+        zip_path: Path,
+        version: str | None = None,
+        expected_sha256: str | None = None,
+    ) -> XsdManifest:
+        """Extract the XSD zip `zip_path` as a new version and make it the current one.
+
+        The zip is extracted to a temporary folder first, which is only
+        renamed to xsd/<version>/ once it is complete. A failed install leaves
+        the current version as it was.
+
+        Args:
+            zip_path (Path): The XSD zip, e.g. downloaded from DATEV_XSD_ZIP_URL.
+            version (str | None, optional): Name of the version. Defaults to None (the name of the zip without suffix).
+            expected_sha256 (str | None, optional): SHA-256 the zip must have. Defaults to None (the one in KNOWN_ZIP_SHA256 of the zip name, not checked for an unknown zip).
+
+        Raises:
+            ValueError: if the zip does not have `expected_sha256` or contains no XSD file.
+
+        Returns:
+            XsdManifest: The manifest of the installed version.
+
+        """
+        zip_sha256 = _sha256(zip_path)
+        if expected_sha256 is None:
+            expected_sha256 = KNOWN_ZIP_SHA256.get(zip_path.name)
+        if expected_sha256 is not None and zip_sha256 != expected_sha256.lower():
+            raise ValueError(
+                f"{zip_path} has the SHA-256 {zip_sha256}, expected {expected_sha256}"
+            )
+        version = version or zip_path.stem
+        _check_version(version)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_folder = Path(tempfile.mkdtemp(prefix=f".{version}.", dir=self.root))
+        try:
+            with ZipFile(zip_path) as thezip:
+                # extractall() keeps the members inside of temp_folder
+                thezip.extractall(temp_folder)
+            files = _file_checksums(temp_folder)
+            if not any(name.lower().endswith(".xsd") for name in files):
+                raise ValueError(f"{zip_path} contains no XSD files")
+            manifest = XsdManifest(
+                version=version,
+                source=zip_path.name,
+                zip_sha256=zip_sha256,
+                installed_at=datetime.now().isoformat(timespec="seconds"),
+                files=files,
+            )
+            with self._lock:
+                self._activate(temp_folder, manifest)
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        return manifest
+
+    def adopt(self, version: str = LEGACY_VERSION) -> XsdManifest:
+        """Move the files of a flat xsd/ folder from before the store into a version and make it the current one.
+
+        Args:
+            version (str, optional): Name of the version. Defaults to LEGACY_VERSION.
+
+        Raises:
+            FileNotFoundError: if the folder has no XSD files outside of the versions.
+            ValueError: if `version` is invalid or already installed.
+
+        Returns:
+            XsdManifest: The manifest of the adopted version.
+
+        """
+        with self._lock:
+            return self._adopt(version)
+
+    def _adopt(self, version: str) -> XsdManifest:
+        _check_version(version)
+        legacy_files = self.legacy_files()
+        if not legacy_files:
+            raise FileNotFoundError(f"No XSD files to adopt in {self.root}")
+        if self.version_folder(version).exists():
+            raise ValueError(f"Version {version} already exists in {self.root}")
+
+        temp_folder = Path(tempfile.mkdtemp(prefix=f".{version}.", dir=self.root))
+        try:
+            for path in legacy_files:
+                os.replace(path, temp_folder / path.name)
+            manifest = XsdManifest(
+                version=version,
+                source=str(self.root),
+                # the zip of a legacy folder is unknown
+                zip_sha256="",
+                installed_at=datetime.now().isoformat(timespec="seconds"),
+                files=_file_checksums(temp_folder),
+            )
+            self._activate(temp_folder, manifest)
+        except BaseException:
+            # put the files back if the version was not created
+            for path in legacy_files:
+                if (temp_folder / path.name).exists():
+                    os.replace(temp_folder / path.name, path)
+            raise
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        return manifest
+
+    def _activate(self, temp_folder: Path, manifest: XsdManifest) -> None:
+        """Write the manifest into `temp_folder`, rename it to its version and make that the current one."""
+        with open(temp_folder / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f, indent=2)
+        target = self.version_folder(manifest.version)
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(temp_folder, target)
+        current_tmp = self.root / (CURRENT_FILE + ".tmp")
+        current_tmp.write_text(manifest.version + "\n", encoding="utf-8")
+        os.replace(current_tmp, self.root / CURRENT_FILE)
+        self._manifest = None
+
+
+xsd_store = XsdStore()
+"""The store of the app in datev_creator/xsd."""
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m datev_creator.xsd_store",
+        description="Manage the local DATEV XSD files, nothing is downloaded.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    install = subparsers.add_parser(
+        "install", help="install an XSD zip as the current version"
+    )
+    install.add_argument("zip", type=Path, help=f"the zip, e.g. {DATEV_XSD_ZIP_URL}")
+    install.add_argument(
+        "--version", help="name of the version, defaults to the zip name"
+    )
+    install.add_argument(
+        "--sha256",
+        help="expected SHA-256 of the zip, defaults to the known one of the zip name",
+    )
+    adopt = subparsers.add_parser(
+        "adopt", help="make the files of a flat xsd folder from before a version"
+    )
+    adopt.add_argument(
+        "--version",
+        default=LEGACY_VERSION,
+        help=f"name of the version, defaults to {LEGACY_VERSION}",
+    )
+    subparsers.add_parser(
+        "verify", help="check the current version against its checksums"
+    )
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "install":
+        try:
+            manifest = xsd_store.install(args.zip, args.version, args.sha256)
+        except (OSError, ValueError) as e:
+            print(f"Install failed: {e}")
+            return 1
+        print(
+            f"Installed {len(manifest.files)} files of {manifest.source} (SHA-256 {manifest.zip_sha256}) as version {manifest.version}"
+        )
+        if args.sha256 is None and args.zip.name not in KNOWN_ZIP_SHA256:
+            print(
+                f"The SHA-256 of {args.zip.name} is not known, add it to KNOWN_ZIP_SHA256 once the zip is verified"
+            )
+        return 0
+    if args.command == "adopt":
+        try:
+            manifest = xsd_store.adopt(args.version)
+        except (OSError, ValueError) as e:
+            print(f"Adopt failed: {e}")
+            return 1
+        print(
+            f"Adopted {len(manifest.files)} files in {xsd_store.root} as version {manifest.version}"
+        )
+        return 0
+
+    version = xsd_store.current_version()
+    problems = xsd_store.verify(version)
+    for problem in problems:
+        print(problem)
+    if not problems:
+        print(f"XSD files {version} are unchanged")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
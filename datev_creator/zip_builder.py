@@ -5,7 +5,10 @@ from typing import Iterable
 
 from datev_creator.archive import Archive
 from datev_creator.ledger_import import LedgerImport
-from datev_creator.xml_validator import validate_xml
+from datev_creator.xml_validator import validate_xml, validate_xml_files
+
+# invalid files listed in the error of build_zip
+MAX_REPORTED_INVALID_FILES = 20
 
 
 def build_zip(
@@ -13,18 +16,25 @@ def build_zip(
     documents: Iterable[tuple[str, LedgerImport]],
     out_path: str | Path,
     other_files: Iterable[str | Path] = [],
+    max_workers: int | None = None,
 ):
     """Builds zip file containing Datev Archive XML and LedgerImport XML files.
 
+    The ledgers are written one at a time with LedgerImport.write, then the
+    written files are validated in parallel (see validate_xml_files), so the
+    serialized XMLs are never all in memory.
+
     Args:
         archive (Archive): _description_
         documents (Iterable[tuple[str, LedgerImport]]): _description_
         out_path (str | Path): _description_
         other_files (Iterable[str  |  Path], optional): _description_. Defaults to [].
+        max_workers (int | None, optional): Processes validating the ledger XMLs, 1 validates in the calling process. Defaults to None (number of CPUs).
 
     Raises:
         FileNotFoundError: if files not found
         e: if xml validation fails
+        ValueError: if ledger XMLs are invalid, with the errors per file
 
     """
     if isinstance(out_path, str):
@@ -54,13 +64,25 @@ def build_zip(
         for file_name, ledger in documents:
             file = temp_dir / file_name
             datev_xml_files.append(file)
-            ledger_xml_etree = ledger.xml
-            try:
-                validate_xml(ledger_xml_etree.getroot())
-            except Exception as e:
-                raise e
-            ledger_xml_etree.write(
-                file, pretty_print=True, xml_declaration=True, encoding="utf-8"
+            ledger.write(file)
+
+        invalid = [
+            result
+            for result in validate_xml_files(
+                [(file.name, file) for file in datev_xml_files],
+                max_workers=max_workers,
+            )
+            if not result.valid
+        ]
+        if invalid:
+            lines = [f"{result.name}: {result.error}" for result in invalid]
+            if len(lines) > MAX_REPORTED_INVALID_FILES:
+                lines = lines[:MAX_REPORTED_INVALID_FILES] + [
+                    f"... and {len(lines) - MAX_REPORTED_INVALID_FILES} more"
+                ]
+            raise ValueError(
+                f"{len(invalid)} of {len(datev_xml_files)} ledger XMLs are invalid:\n"
+                + "\n".join(lines)
             )
 
         zip_content_paths = [
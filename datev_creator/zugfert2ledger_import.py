@@ -1,12 +1,14 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from io import BytesIO
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable, Iterator, Mapping
 
 from drafthorse.models.document import Document
-from drafthorse.models.party import TaxRegistration
-from drafthorse.models.payment import PaymentTerms
-from drafthorse.models.tradelines import LineItem, LineSettlement, LineSummation
+from lxml import etree
 
 from converter_app import settings
+from datev_creator.cii_extractor import CII_ROOT_TAG, cii_facts
+from datev_creator.invoice_facts import InvoiceFacts, facts_from_document
 from datev_creator.ledger_import import (
     AccountsReceivableLedger,
     Base,
@@ -14,10 +16,19 @@ from datev_creator.ledger_import import (
     Consolidate,
     LedgerImport,
 )
+from datev_creator.ubl_extractor import UBL_ROOT_TAGS, ubl_facts
 from datev_creator.utils import SOFTWARE_NAME
 
 LEDGER_XML_DATA = "Kopie nur zur Verbuchung berechtigt nicht zum Vorsteuerabzug"
 
+AccountNoKey = tuple[str | None, str]
+"""(customer_number, invoice_id) of a ledger, the arguments of bp_account_no_retrieval"""
+
+BulkAccountNoRetrieval = Callable[
+    [Iterable[AccountNoKey]], dict[AccountNoKey, str | None]
+]
+"""Looks up the account numbers of many (customer_number, invoice_id) pairs at once"""
+
 
 def import_zugfert(xml_path: Path) -> Document:
     if not xml_path.exists():
@@ -26,9 +37,35 @@ def import_zugfert(xml_path: Path) -> Document:
     with open(xml_path, "rb") as f:
         xml = f.read()
 
+    return import_zugfert_bytes(xml)
+
+
+def import_zugfert_bytes(xml: bytes) -> Document:
     return Document.parse(xml)
 
 
+def sniff_root_tag(xml: bytes) -> str:
+    """Return the namespaced tag of the root element, without parsing the rest of the document."""
+    for _, element in etree.iterparse(BytesIO(xml), events=("start",)):
+        return element.tag
+    raise ValueError("XML has no root element")
+
+
+def invoice_facts_from_bytes(xml: bytes) -> InvoiceFacts:
+    """Read the InvoiceFacts of a CII or UBL invoice, the syntax is detected from the root element.
+
+    Raises:
+        ValueError: if the XML is neither a CII nor a UBL invoice.
+
+    """
+    root_tag = sniff_root_tag(xml)
+    if root_tag == CII_ROOT_TAG:
+        return cii_facts(etree.fromstring(xml))
+    if root_tag in UBL_ROOT_TAGS:
+        return ubl_facts(etree.fromstring(xml))
+    raise ValueError(f"Unsupported invoice syntax, root element: {root_tag}")
+
+
 def create_ledgger(
     issue_date_time: str,
     currency_code: str,
@@ -100,74 +137,217 @@ def create_ledgger(
     )
 
 
-def ledger_from_document(
+def ledger_from_facts(
     bp_account_no_retrieval: Callable[[str | None, str], str | None],
-    document: Document,
+    facts: InvoiceFacts,
     item_amount: str,
-    buyer_id: str | None,
-    invoice_id: str,
     bu_code: str,
     tax_rate: str | None,
-    seller_tax_id: str | None,
-    ship_from_country: str | None,
-    buyer_tax_id: str | None,
-    ship_to_country: str | None,
-    due_date: str | None,
-    delivery_date: str | None,
-    order_id: str | None,
     information_text: str | None,
     booking_text: str | None = None,
 ) -> AccountsReceivableLedger:
     return create_ledgger(
-        issue_date_time=str(document.header.issue_date_time)
-        if document.header.issue_date_time
-        else "",
-        currency_code=str(document.trade.settlement.currency_code)
-        if document.trade.settlement.currency_code
-        else "EUR",
-        buyer_name=str(document.trade.agreement.buyer.name),
-        buyer_city=str(document.trade.agreement.buyer.address.city_name)
-        if document.trade.agreement.buyer.address
-        else None,
+        issue_date_time=facts.issue_date,
+        currency_code=facts.currency_code,
+        buyer_name=facts.buyer_name,
+        buyer_city=facts.buyer_city,
         bp_account_no_retrieval=bp_account_no_retrieval,
         item_amount=item_amount,
-        buyer_id=buyer_id,
-        invoice_id=invoice_id,
+        buyer_id=facts.buyer_id,
+        invoice_id=facts.invoice_id,
         bu_code=bu_code,
         tax_rate=tax_rate,
-        seller_tax_id=seller_tax_id,
-        ship_from_country=ship_from_country,
-        buyer_tax_id=buyer_tax_id,
-        ship_to_country=ship_to_country,
-        due_date=due_date,
-        delivery_date=delivery_date,
-        order_id=order_id,
+        seller_tax_id=facts.seller_tax_id,
+        ship_from_country=facts.ship_from_country,
+        buyer_tax_id=facts.buyer_tax_id,
+        ship_to_country=facts.ship_to_country,
+        due_date=facts.due_date,
+        delivery_date=facts.delivery_date,
+        order_id=facts.order_id,
         information_text=information_text,
         booking_text=booking_text,
     )
 
 
-def get_tax_rate(item: LineItem) -> tuple[float, str]:
-    if (
-        hasattr(item, "settlement")
-        and item.settlement
-        and hasattr(item.settlement, "trade_tax")
-        and item.settlement.trade_tax
-        and hasattr(item.settlement.trade_tax, "rate_applicable_percent")
-    ):
-        tax_rate_float = float(
-            str(item.settlement.trade_tax.rate_applicable_percent.__str__())
+def get_bu_code(tax_rate: str, bu_codes: Mapping[str, str] | None = None) -> str:
+    """Look up the BU code (Buchungsschlüssel) of a tax rate.
+
+    Args:
+        tax_rate (str): The tax rate as written to the ledger, e.g. "19.00".
+        bu_codes (Mapping[str, str] | None, optional): BU code per tax rate. Defaults to the bu_codes setting.
+
+    Raises:
+        ValueError: when the tax rate has no BU code
+
+    Returns:
+        str: The BU code.
+
+    """
+    if bu_codes is None:
+        bu_codes = settings.Settings.getinstance().bu_codes
+    try:
+        return bu_codes[tax_rate]
+    except KeyError:
+        raise ValueError(
+            f"Unexpected tax rate: {tax_rate}, no BU code configured (bu_codes in settings.json)"
+        ) from None
+
+
+def group_by_tax_rate(facts: InvoiceFacts) -> dict[str, Decimal]:
+    """Sum up the line item amounts per tax rate, in one pass over the lines.
+
+    Raises:
+        ValueError: when a line has no or no numeric amount (LineTotalAmount)
+
+    Returns:
+        dict[str, Decimal]: The net amount per tax rate ("19.00"), in the order the rates occur.
+
+    """
+    net_amounts: dict[str, Decimal] = {}
+    for i, line in enumerate(facts.lines, start=1):
+        try:
+            amount = Decimal(line.amount)
+        except InvalidOperation:
+            raise ValueError(
+                f"Line {i} ({line.product_name!r}) of invoice {facts.invoice_id} has no valid amount: {line.amount!r}, cannot group by tax rate"
+            ) from None
+        net_amount = net_amounts.get(line.tax_rate, Decimal(0))
+        net_amounts[line.tax_rate] = net_amount + amount
+    return net_amounts
+
+
+def gross_amount(net_amount: Decimal, tax_rate: str) -> Decimal:
+    """The net amount plus its tax, rounded to cents like the tax of an invoice."""
+    tax = (net_amount * Decimal(tax_rate) / 100).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+    return net_amount + tax
+
+
+def iter_ledgers_from_facts(
+    facts: InvoiceFacts,
+    bp_account_no_retrieval: Callable[[str | None, str], str | None],
+    items_as_ledgers: bool = False,
+    group_tax_rates: bool = False,
+) -> Iterator[AccountsReceivableLedger]:
+    """Create the ledgers of an invoice one at a time, see ledgers_from_facts.
+
+    A Consolidate keeps the ledgers in a list, LedgerImport.write then builds
+    the XML of only one ledger at a time.
+
+    Args:
+        facts (InvoiceFacts): The invoice fields, from any of the extractors.
+        bp_account_no_retrieval (Callable[[str | None, str], str | None]): function retrieveing account_no given a [customer_number] and invoice ID.
+        items_as_ledgers (bool, optional): Whether to create one ledger per item (True) or one ledger for the whole invoice (False). Defaults to False.
+        group_tax_rates (bool, optional): If not items_as_ledgers, create one ledger per tax rate instead of failing for invoices with multiple tax rates. Defaults to False.
+
+    Raises:
+        ValueError: when the invoice has no ID or a tax rate has no BU code, raised when the ledger is reached
+
+    Yields:
+        AccountsReceivableLedger: The ledgers.
+
+    """
+    # "None" is what the extractors read from an empty ID element
+    if not facts.invoice_id or facts.invoice_id == "None":
+        raise ValueError("Invoice needs to have an ID, but it does not.")
+    if items_as_ledgers:
+        if len(facts.lines) == 0:
+            return
+        # the customer and invoice are the same for all items, only look up once
+        bp_account_no = bp_account_no_retrieval(facts.buyer_id, facts.invoice_id)
+        for line in facts.lines:
+            yield ledger_from_facts(
+                bp_account_no_retrieval=lambda customer_number, invoice_id: (
+                    bp_account_no
+                ),
+                facts=facts,
+                item_amount=line.amount,
+                bu_code=get_bu_code(line.tax_rate),
+                tax_rate=line.tax_rate,
+                information_text=line.product_name[:120],
+                booking_text=line.product_name[:30],
+            )
+        return
+
+    # only the rates, the line amounts are not needed for a single rate
+    tax_rates = list(dict.fromkeys(line.tax_rate for line in facts.lines))
+    if len(tax_rates) > 1 and group_tax_rates:
+        net_amounts = group_by_tax_rate(facts)
+        # one gross ledger per tax rate, together they must make up the invoice
+        gross_amounts = {
+            tax_rate: gross_amount(net_amount, tax_rate)
+            for tax_rate, net_amount in net_amounts.items()
+        }
+        if sum(gross_amounts.values()) != Decimal(facts.grand_total):
+            raise ValueError(
+                f"Tax rate totals {gross_amounts} do not add up to the grand total {facts.grand_total}, cannot group by tax rate"
+            )
+        bp_account_no = bp_account_no_retrieval(facts.buyer_id, facts.invoice_id)
+        for tax_rate, amount in gross_amounts.items():
+            yield ledger_from_facts(
+                bp_account_no_retrieval=lambda customer_number, invoice_id: (
+                    bp_account_no
+                ),
+                facts=facts,
+                item_amount=str(amount),
+                bu_code=get_bu_code(tax_rate),
+                tax_rate=tax_rate,
+                information_text=f"Ausgangsrechnung {facts.invoice_id} {tax_rate}%",
+                booking_text=facts.buyer_name[:30],
+            )
+        return
+
+    if len(tax_rates) != 1:
+        raise ValueError(
+            f"Multiple tax rates found in document, cannot create single ledger: {set(tax_rates)}"
         )
-        tax_rate = f"{tax_rate_float:.2f}"
-        return tax_rate_float, tax_rate
-    else:
-        raise ValueError("Item does not have a valid tax rate")
+    (tax_rate,) = tax_rates
+
+    yield ledger_from_facts(
+        bp_account_no_retrieval=bp_account_no_retrieval,
+        facts=facts,
+        item_amount=facts.grand_total,
+        bu_code=get_bu_code(tax_rate),
+        tax_rate=tax_rate,
+        information_text=f"Ausgangsrechnung {facts.invoice_id}",
+        booking_text=facts.buyer_name[:30],
+    )
+
+
+def ledgers_from_facts(
+    facts: InvoiceFacts,
+    bp_account_no_retrieval: Callable[[str | None, str], str | None],
+    items_as_ledgers: bool = False,
+    group_tax_rates: bool = False,
+) -> list[AccountsReceivableLedger]:
+    """Create the ledgers of an invoice.
+
+    Args:
+        facts (InvoiceFacts): The invoice fields, from any of the extractors.
+        bp_account_no_retrieval (Callable[[str | None, str], str | None]): function retrieveing account_no given a [customer_number] and invoice ID.
+        items_as_ledgers (bool, optional): Whether to create one ledger per item (True) or one ledger for the whole invoice (False). Defaults to False.
+        group_tax_rates (bool, optional): If not items_as_ledgers, create one ledger per tax rate instead of failing for invoices with multiple tax rates. Defaults to False.
+
+    Raises:
+        ValueError: when the invoice has no ID or a tax rate has no BU code
+
+    Returns:
+        list[AccountsReceivableLedger]: The list of ledgers.
+
+    """
+    return list(
+        iter_ledgers_from_facts(
+            facts, bp_account_no_retrieval, items_as_ledgers, group_tax_rates
+        )
+    )
 
 
 def retrieve_ledgers(
     document: Document,
     bp_account_no_retrieval: Callable[[str | None, str], str | None],
     items_as_ledgers: bool = False,
+    group_tax_rates: bool = False,
 ) -> list[AccountsReceivableLedger]:
     """Retrieve ledgers from FractureX xml document.
 
@@ -175,221 +355,90 @@ def retrieve_ledgers(
         document (Document): The drafthorse Document object.
         bp_account_no_retrieval (Callable[[str | None, str], str | None]): function retrieveing account_no given a [customer_number] and invoice ID.
         items_as_ledgers (bool, optional): Whether to create one ledger per item (True) or one ledger for the whole invoice (False). Defaults to False.
+        group_tax_rates (bool, optional): If not items_as_ledgers, create one ledger per tax rate instead of failing for invoices with multiple tax rates. Defaults to False.
 
     Raises:
-        ValueError: when tax rate is not 0% or 19%
+        ValueError: when a tax rate has no BU code
 
     Returns:
         list[AccountsReceivableLedger]: The list of ledgers.
 
     """
-    item: LineItem
-    settlement: LineSettlement
-    monetary_summation: LineSummation
-    tax_rate: str | None
-    tax_rate_float: float | None
-    bu_code: str
-
-    buyer_id = (
-        str(document.trade.agreement.buyer.id)
-        if hasattr(document.trade.agreement.buyer, "id")
-        else None
+    return ledgers_from_facts(
+        facts_from_document(document),
+        bp_account_no_retrieval,
+        items_as_ledgers,
+        group_tax_rates,
     )
-    if document.header.id:
-        invoice_id = str(document.header.id)
-    else:
-        raise ValueError("Invoice needs to have an ID, but it does not.")
 
-    # Get seller tax ID
-    tax_registrations: list[TaxRegistration]
-    seller_tax_id = None
-    if (
-        hasattr(document.trade.agreement.seller, "tax_registrations")
-        and (document.trade.agreement.seller.tax_registrations)
-        and (
-            tax_registrations
-            := document.trade.agreement.seller.tax_registrations.children
-        )
-        and len(tax_registrations) > 0
-    ):
-        seller_tax_id = (
-            str(tax_registrations[0].id).strip().removesuffix("(VA)").strip()
-        )
 
-    # Get buyer tax ID
-    buyer_tax_id = None
-    if (
-        hasattr(document.trade.agreement.buyer, "tax_registrations")
-        and document.trade.agreement.buyer.tax_registrations
-        and (
-            tax_registrations
-            := document.trade.agreement.buyer.tax_registrations.children
-        )
-        and len(tax_registrations) > 0
-    ):
-        buyer_tax_id = str(tax_registrations[0].id)
-
-    # Get country codes
-    ship_from_country = None
-    if (
-        hasattr(document.trade.agreement.seller, "address")
-        and document.trade.agreement.seller.address
-        and hasattr(document.trade.agreement.seller.address, "country_id")
-    ):
-        ship_from_country = str(document.trade.agreement.seller.address.country_id)
-
-    ship_to_country = None
-    if (
-        hasattr(document.trade.agreement.buyer, "address")
-        and document.trade.agreement.buyer.address
-        and hasattr(document.trade.agreement.buyer.address, "country_id")
-    ):
-        ship_to_country = str(document.trade.agreement.buyer.address.country_id)
-
-    # Get due date from settlement terms
-    terms: list[PaymentTerms]
-    due_date = None
-    if (
-        hasattr(document.trade.settlement, "terms")
-        and document.trade.settlement.terms
-        and (terms := document.trade.settlement.terms.children)
-        and hasattr(terms, "due")
-    ):
-        due_date = str(terms[0].due)
-
-    # Get delivery date from delivery event occurrence
-    delivery_date = None
-    if (
-        hasattr(document.trade.delivery, "event")
-        and document.trade.delivery.event
-        and hasattr(document.trade.delivery.event, "occurrence")
-    ):
-        delivery_date = str(document.trade.delivery.event.occurrence)
-
-    # Get buyer order reference - correct attribute name is buyer_order
-    order_id = None
-    if (
-        hasattr(document.trade.agreement, "buyer_order")
-        and document.trade.agreement.buyer_order
-        and hasattr(document.trade.agreement.buyer_order, "issuer_assigned_id")
-        and document.trade.agreement.buyer_order.issuer_assigned_id._data
-    ):
-        print(document.trade.agreement.buyer_order.issuer_assigned_id)
-        order_id = str(document.trade.agreement.buyer_order.issuer_assigned_id)
+def iter_retrieve_ledgers(
+    document: Document,
+    bp_account_no_retrieval: Callable[[str | None, str], str | None],
+    items_as_ledgers: bool = False,
+    group_tax_rates: bool = False,
+) -> Iterator[AccountsReceivableLedger]:
+    """Generator variant of retrieve_ledgers, see iter_ledgers_from_facts."""
+    return iter_ledgers_from_facts(
+        facts_from_document(document),
+        bp_account_no_retrieval,
+        items_as_ledgers,
+        group_tax_rates,
+    )
 
-    if items_as_ledgers:
-        ledgers: list[AccountsReceivableLedger] = []
-
-        for item in document.trade.items.children:
-            # Get item amount - try different price sources
-            item_amount = ""
-            if (
-                hasattr(item, "settlement")
-                and (settlement := item.settlement)
-                and hasattr(settlement, "monetary_summation")
-                and (monetary_summation := settlement.monetary_summation)
-            ):
-                item_amount = str(monetary_summation.total_amount.__str__())
-            elif (
-                hasattr(item, "agreement")
-                and item.agreement
-                and hasattr(item.agreement, "gross")
-                and item.agreement.gross
-            ):
-                item_amount = str(item.agreement.gross.amount)
-            elif (
-                hasattr(item, "agreement")
-                and item.agreement
-                and hasattr(item.agreement, "net")
-                and item.agreement.net
-            ):
-                item_amount = str(item.agreement.net.amount)
-
-            # Get tax rate from settlement.trade_tax
-            tax_rate = None
-            tax_rate_float = None
-            if (
-                hasattr(item, "settlement")
-                and item.settlement
-                and hasattr(item.settlement, "trade_tax")
-                and item.settlement.trade_tax
-                and hasattr(item.settlement.trade_tax, "rate_applicable_percent")
-            ):
-                tax_rate_float = float(
-                    str(item.settlement.trade_tax.rate_applicable_percent.__str__())
-                )
-                tax_rate = f"{tax_rate_float:.2f}"
-
-            # BU CODE only works for our use case where only two BU Codes are used (19% or 0%) (where 0% is 200)
-
-            if tax_rate_float == 19.0:
-                bu_code = "3"
-            elif tax_rate_float == 0.0:
-                bu_code = "200"
-            else:
-                raise ValueError(f"Unexpected tax rate: {tax_rate_float}")
-
-            ledgers.append(
-                ledger_from_document(
-                    document=document,
-                    item_amount=item_amount,
-                    buyer_id=buyer_id,
-                    invoice_id=invoice_id,
-                    bu_code=bu_code,
-                    tax_rate=tax_rate,
-                    seller_tax_id=seller_tax_id,
-                    ship_from_country=ship_from_country,
-                    buyer_tax_id=buyer_tax_id,
-                    ship_to_country=ship_to_country,
-                    due_date=due_date,
-                    delivery_date=delivery_date,
-                    order_id=order_id,
-                    bp_account_no_retrieval=bp_account_no_retrieval,
-                    information_text=str(item.product.name)[:120]
-                    if item.product and item.product.name
-                    else None,
-                    booking_text=str(item.product.name)[:30]
-                    if item.product and item.product.name
-                    else None,
-                )
-            )
-        return ledgers
-    else:
-        tax_rates = {get_tax_rate(item) for item in document.trade.items.children}
-        if len(tax_rates) != 1:
-            raise ValueError(
-                f"Multiple tax rates found in document, cannot create single ledger: {tax_rates}"
-            )
-        tax_rate_float, tax_rate = tax_rates.pop()
-        if tax_rate_float == 19.0:
-            bu_code = "3"
-        elif tax_rate_float == 0.0:
-            bu_code = "200"
-        else:
-            raise ValueError(f"Unexpected tax rate: {tax_rate_float}")
-
-        return [
-            ledger_from_document(
-                document=document,
-                item_amount=str(
-                    document.trade.settlement.monetary_summation.grand_total._amount
-                ),
-                buyer_id=buyer_id,
-                invoice_id=invoice_id,
-                bu_code=bu_code,
-                tax_rate=tax_rate,
-                seller_tax_id=seller_tax_id,
-                ship_from_country=ship_from_country,
-                buyer_tax_id=buyer_tax_id,
-                ship_to_country=ship_to_country,
-                due_date=due_date,
-                delivery_date=delivery_date,
-                order_id=order_id,
-                bp_account_no_retrieval=bp_account_no_retrieval,
-                information_text=f"Ausgangsrechnung {invoice_id}",
-                booking_text=str(document.trade.agreement.buyer.name)[:30],
+
+def assign_bp_account_no(
+    ledger_import: LedgerImport,
+    bp_account_no_retrieval: Callable[[str | None, str], str | None],
+) -> None:
+    """Look up the missing bp_account_no of all receivable ledgers.
+
+    Used when the ledgers were created without account lookup (e.g. in a worker process).
+    """
+    for ledger in ledger_import.consolidate.ledgers:
+        if (
+            isinstance(ledger, AccountsReceivableLedger)
+            and ledger.base1.bp_account_no is None
+        ):
+            ledger.base1.bp_account_no = bp_account_no_retrieval(
+                ledger.base1.party_id, ledger.base1.invoice_id
             )
-        ]
+
+
+def missing_bp_account_no_keys(ledger_import: LedgerImport) -> set[AccountNoKey]:
+    """The (customer_number, invoice_id) of all receivable ledgers without bp_account_no."""
+    return {
+        (ledger.base1.party_id, ledger.base1.invoice_id)
+        for ledger in ledger_import.consolidate.ledgers
+        if isinstance(ledger, AccountsReceivableLedger)
+        and ledger.base1.bp_account_no is None
+    }
+
+
+def assign_bp_account_nos(
+    ledger_imports: Iterable[LedgerImport],
+    bp_account_nos_retrieval: BulkAccountNoRetrieval,
+) -> None:
+    """Look up the missing bp_account_no of all receivable ledgers of many imports at once.
+
+    Like assign_bp_account_no, but `bp_account_nos_retrieval` is called once
+    with the keys of all ledgers, e.g. to resolve them with a few bulk queries.
+    """
+    ledger_imports = list(ledger_imports)
+    keys: set[AccountNoKey] = set()
+    for ledger_import in ledger_imports:
+        keys |= missing_bp_account_no_keys(ledger_import)
+    if len(keys) == 0:
+        return
+
+    account_nos = bp_account_nos_retrieval(keys)
+    for ledger_import in ledger_imports:
+        assign_bp_account_no(
+            ledger_import,
+            lambda customer_number, invoice_id: account_nos.get(
+                (customer_number, invoice_id)
+            ),
+        )
 
 
 def zugfert_to_ledger_import(
@@ -407,30 +456,74 @@ def zugfert_to_ledger_import(
         tuple: (etree._ElementTree, year, month)
 
     """
-    document = import_zugfert(xml_path)
-    ledgers = retrieve_ledgers(document, bp_account_no_retrieval)
+    if not xml_path.exists():
+        raise FileNotFoundError(f"XML file not found: {xml_path}")
+
+    with open(xml_path, "rb") as f:
+        xml = f.read()
+
+    return zugfert_bytes_to_ledger_import(xml, bp_account_no_retrieval)
+
+
+def zugfert_bytes_to_ledger_import(
+    xml: bytes,
+    bp_account_no_retrieval: Callable[
+        [str | None, str], str | None
+    ] = lambda customer_number, invoice_id: None,
+    use_drafthorse: bool = False,
+) -> tuple[LedgerImport, tuple[int, int]]:
+    """Convert Zugferd/XRechnung (CII or UBL) XML content to a LedgerImport, e.g. the XML embedded in a PDF.
+
+    xml (bytes): Content of the Zugferd XML file.
+    account_no_retrieval (Callable[[str | None, str], str | None]): function retrieveing account_no given a [customer_number] and invoice ID.
+    use_drafthorse (bool): Parse the full drafthorse Document instead of only reading the needed fields with lxml (same result, but slower, strict about unknown elements and CII only).
+
+    Returns:
+        tuple: (LedgerImport, (year, month))
+
+    """
+    if use_drafthorse:
+        facts = facts_from_document(import_zugfert_bytes(xml))
+    else:
+        facts = invoice_facts_from_bytes(xml)
+    return facts_to_ledger_import(facts, bp_account_no_retrieval)
+
+
+def facts_to_ledger_import(
+    facts: InvoiceFacts,
+    bp_account_no_retrieval: Callable[
+        [str | None, str], str | None
+    ] = lambda customer_number, invoice_id: None,
+) -> tuple[LedgerImport, tuple[int, int]]:
+    """Create the LedgerImport of an invoice, with one ledger per tax rate.
+
+    facts (InvoiceFacts): The invoice fields.
+    account_no_retrieval (Callable[[str | None, str], str | None]): function retrieveing account_no given a [customer_number] and invoice ID.
+
+    Raises:
+        ValueError: when the invoice has no ID or a tax rate has no BU code
+
+    Returns:
+        tuple: (LedgerImport, (year, month))
+
+    """
+    ledgers = ledgers_from_facts(facts, bp_account_no_retrieval, group_tax_rates=True)
 
     ledger_import_xml = LedgerImport(
-        generator_info=str(document.trade.agreement.seller.name),
+        generator_info=facts.seller_name,
         xml_data=LEDGER_XML_DATA,
         consolidate=Consolidate(
-            # find document reference in /home/silas/Documents/coding/python/datev/.venv/lib/python3.13/site-packages/drafthorse/models/*
-            consolidated_amount=str(
-                document.trade.settlement.monetary_summation.grand_total._amount
-            ),
-            #             ExchangedDocument
-            # IssueDateTime
-            # DateTimeString
-            consolidated_date=str(document.header.issue_date_time),
-            consolidated_currency_code=str(document.trade.settlement.currency_code),
+            consolidated_amount=facts.grand_total,
+            consolidated_date=facts.issue_date,
+            consolidated_currency_code=facts.currency_code,
             ledgers=ledgers,
-            consolidated_invoice_id=str(document.header.id),
-            consolidated_delivery_date=str(document.trade.delivery.event.occurrence),
+            consolidated_invoice_id=facts.invoice_id,
+            consolidated_delivery_date=facts.delivery_date,
             consolidated_order_id=None,
         ),
         generating_system=SOFTWARE_NAME,
     )
-    split_date = str(document.header.issue_date_time).split("-")
+    split_date = facts.issue_date.split("-")
     return ledger_import_xml, (
         int(split_date[0]),
         int(split_date[1]),
@@ -31,5 +31,5 @@ if errorlevel 1 exit /b 1
 "%PYEXE%" -m pip install -r requirements.txt
 if errorlevel 1 exit /b 1
 
-"%PYEXE%" database_kunden_csv_generator.py
+"%PYEXE%" database_kunden_csv_generator.py %*
 endlocal
\ No newline at end of file
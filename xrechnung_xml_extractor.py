@@ -2,7 +2,7 @@ from pathlib import Path
 from tkinter import messagebox
 from tkinter.filedialog import askdirectory, askopenfilenames
 
-from pypdf import PdfReader
+from datev_creator.pdf_attachment import extract_invoice_xml, may_contain_invoice_xml
 
 
 def main():
@@ -39,29 +39,16 @@ def main():
 
 
 def extract_xml_from_pdf(pdf: Path, xml_folder: Path) -> Path | None:
-    file_name = pdf.name
-    # pdf = Path(file_name)
-    reader = PdfReader(pdf)
-    attachments = {}
-
-    catalog = reader.trailer["/Root"]
-    print(catalog)
-    if "/Names" in catalog and "/EmbeddedFiles" in catalog["/Names"]:
-        fileNames = catalog["/Names"]["/EmbeddedFiles"]["/Names"]
-        for f in fileNames:
-            print(f)
-            if isinstance(f, str) and f == "factur-x.xml":
-                name = f
-                dataIndex = fileNames.index(f) + 1
-                fDict = fileNames[dataIndex].get_object()
-                fData = fDict["/EF"]["/F"].get_data()
-                attachments[name] = fData
-
-                tempdir_path = xml_folder / (file_name + ".xml")
-                with open(tempdir_path, "wb") as xml_file:
-                    xml_file.write(fData)
-                return tempdir_path
-    return None
+    if not may_contain_invoice_xml(pdf):
+        return None
+    xml = extract_invoice_xml(pdf)
+    if xml is None:
+        return None
+
+    xml_path = xml_folder / (pdf.name + ".xml")
+    with open(xml_path, "wb") as xml_file:
+        xml_file.write(xml)
+    return xml_path
 
 
 if __name__ == "__main__":